@@ -0,0 +1,103 @@
+# Lookup time of compiled json paths against the previous recursive
+# get_dict_field, for the json.* fields of a config on a synthetic paper and
+# list, and for the config lookups the fetcher does. Both versions are first
+# checked to give the same value or raise the same error on a set of edge cases.
+#
+#   python benchmarks/json_path.py ieee --repeat 5
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers as h
+
+def recursive_get_dict_field(d, field, default=None):
+    def throw():
+        if default is None:
+            raise ValueError("%s could not be found in dict", field)
+        else:
+            return default
+
+    if not isinstance(d, dict) and not isinstance(d, list):
+        raise Exception(f"Should not try to access other than dicts and lists: {type(d)}")
+
+    i = field.find(".")
+    if i > -1:
+        key = field[0:i]
+        if key == '*' and isinstance(d, list):
+            res = []
+            for value in d:
+                res.append(recursive_get_dict_field(value, field[i+1:]))
+            return res
+        elif isinstance(d, list):
+            try:
+                index = int(key)
+                return recursive_get_dict_field(d[index], field[i+1:])
+            except:
+                return throw()
+        if key not in d: return throw()
+        return recursive_get_dict_field(d[key], field[i+1:])
+
+    if field not in d: return throw()
+    return d[field]
+
+def synthetic_paper(authors=6, keywords=3):
+    return {
+        'title': 'A paper', 'abstract': 'About things', 'doi': '10.1109/1.2',
+        'publicationDate': '2019', 'publicationTitle': 'IEEE VR',
+        'authors': [{ 'name': 'Author %d' % i, 'affiliation': 'X' } for i in range(authors)],
+        'keywords': [{ 'type': 'IEEE', 'kwd': ['k%d' % i, 'l%d' % i] } for i in range(keywords)],
+        'isbn': [{ 'format': 'Print', 'value': '978-1' }],
+        'metrics': { 'citationCountPaper': 12 },
+    }
+
+EDGE_CASES = [
+    ({ 'a': { 'b': 1 } }, 'a.b', None), ({ 'a': { 'b': 1 } }, 'a.c', ''), ({ 'a': { 'b': 1 } }, 'c.b', ''),
+    ({ 'a': [1, 2] }, 'a.1', None), ({ 'a': [1, 2] }, 'a.5', ''), ([{ 'a': 1 }], '0.a', ''), ([{ 'a': 1 }], '3.a', ''),
+    ([{ 'a': 1 }], 'x.a', ''), ([{ 'a': { 'b': 1 } }], '0.a.c', ''), ([{ 'a': 1 }, { 'b': 2 }], '*.a', ''),
+    ([{ 'a': 1 }], '*', ''), (['a'], 'a', ''), ({ '*': { 'a': 1 } }, '*.a', None), ({ 'a': 'text' }, 'a.b', ''),
+    ([{ 'a': 'text' }], '0.a.b', ''), ('text', 'a', ''), ({ 'a': [[{ 'b': 1 }]] }, 'a.*.*.b', None),
+    ({ 'a': [{ 'b': 1 }] }, 'a.-1.b', None), ({}, '', ''), ({ '': 1 }, '', None),
+]
+
+def outcome(get, d, path, default):
+    try: return ('value', get(d, path, default))
+    except Exception as e: return (type(e).__name__, str(e))
+
+def best_of(fun, repeat, number):
+    best = None
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        for _ in range(number): fun()
+        toc = time.perf_counter()
+        best = toc - tic if best is None else min(best, toc - tic)
+    return best / number
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config_name')
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with open("./configs/%s.json" % args.config_name, "r") as f:
+        config = json.load(f)
+    paper, _list = synthetic_paper(), { 'totalRecords': 10, 'records': [{ 'articleNumber': str(i) } for i in range(25)] }
+
+    lookups = [(config, field, None) for field in ['urls.list.url', 'urls.paper.expect-json', 'json.paper.title', 'regex.paper.title']]
+    for key in ['paper', 'list']:
+        fields = config.get('json', {}).get(key, {})
+        lookups += [(paper if key == 'paper' else _list, path, '') for path in fields.values()]
+
+    for d, path, default in EDGE_CASES + lookups:
+        expected, got = outcome(recursive_get_dict_field, d, path, default), outcome(h.get_dict_field, d, path, default)
+        if expected != got: sys.exit("%s differs: %s != %s" % (path, got, expected))
+
+    def run(get): return lambda: [get(d, path, default) if default is not None else outcome(get, d, path, default) for d, path, default in lookups]
+    before = best_of(run(recursive_get_dict_field), args.repeat, args.number)
+    after = best_of(run(h.get_dict_field), args.repeat, args.number)
+    print(f"{args.config_name}: {len(lookups)} lookups, {len(EDGE_CASES)} edge cases agree")
+    print(f"  recursive: {before * 1e6:8.2f} us/round")
+    print(f"  compiled:  {after * 1e6:8.2f} us/round ({before / after:0.2f}x)")
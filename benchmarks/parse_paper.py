@@ -0,0 +1,79 @@
+# Per-paper parse time of the compiled extraction plan against the previous
+# config-walking implementation, of the single-pass extractor for regex
+# configs, and of a lookup in the memoized records, over paper pages already
+# in the cache.
+#
+#   python benchmarks/parse_paper.py acm --cache-folder ./cache --limit 1000
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import helpers as h
+from extraction import PAPER_FIELDS, first_match, unique_matches
+from finder import Fetcher
+
+def legacy_from_paper(fetcher, key, _paper):
+    fun = first_match if PAPER_FIELDS[key] else unique_matches
+    is_pre_json = 'embedded_json' in fetcher.get_config("preprocessing.paper.*.type", [])
+    return fun(fetcher.get_config("regex.paper.%s" % key), _paper) \
+        if not is_pre_json else \
+        h.get_dict_field(_paper, fetcher.get_config("json.paper.%s" % key), '')
+
+def legacy_parse_paper(fetcher, identifier, _paper):
+    for pre in fetcher.preprocessing_paper:
+        if pre["type"] == "embedded_json":
+            _paper = json.loads(first_match(pre['regex'], _paper))
+    paper = { key: legacy_from_paper(fetcher, key, _paper) for key in PAPER_FIELDS }
+    paper['authors'] = list(map(lambda s: s.title(), h.flatten(paper['authors'])))
+    paper['keywords'] = h.flatten(paper['keywords'])
+    paper['doi_url'] = "https://doi.org/%s" % paper['doi']
+    paper['pdf_url'] = fetcher.pdf_url(identifier)
+    paper['pdf_file_name'] = fetcher.pdf_file_name(identifier, True)
+    paper['paper_url'] = fetcher.paper_url(identifier)
+    paper['identifier'] = identifier
+    return fetcher.postprocess_paper(paper)
+
+def load_pages(fetcher, limit):
+    keys = sorted(fetcher.cache.keys('paper'))[:limit]
+    return [(key, fetcher.cache.read('paper', key)) for key in keys]
+
+def time_per_paper(parse, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        for identifier, _paper in pages: parse(identifier, _paper)
+        toc = time.perf_counter()
+        best = toc - tic if best is None else min(best, toc - tic)
+    return best / len(pages)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config_name')
+    parser.add_argument('--cache-folder', default='./cache')
+    parser.add_argument('--cache-backend', default='files')
+    parser.add_argument('--limit', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fetcher = Fetcher(name=args.config_name, config_name=args.config_name, cache_folder=args.cache_folder, cache_backend=args.cache_backend, extraction='per-field', record_cache=False)
+    single_pass = Fetcher(name=args.config_name, config_name=args.config_name, cache_folder=args.cache_folder, cache_backend=args.cache_backend, extraction='single-pass', record_cache=False)
+    memoized = Fetcher(name=args.config_name, config_name=args.config_name, cache_folder=args.cache_folder, cache_backend=args.cache_backend)
+    pages = load_pages(fetcher, args.limit)
+    if len(pages) == 0: sys.exit("no cached papers found for %s in %s" % (args.config_name, args.cache_folder))
+
+    before = time_per_paper(lambda i, p: legacy_parse_paper(fetcher, i, p), pages, args.repeat)
+    after = time_per_paper(fetcher.parse_paper, pages, args.repeat)
+    print(f"{args.config_name}: {len(pages)} cached papers")
+    print(f"  config walk:     {before * 1e6:10.1f} us/paper")
+    print(f"  extraction plan: {after * 1e6:10.1f} us/paper ({before / after:0.2f}x)")
+    if single_pass.extraction_plan.single_pass is not None:
+        single = time_per_paper(single_pass.parse_paper, pages, args.repeat)
+        print(f"  single pass:     {single * 1e6:10.1f} us/paper ({before / single:0.2f}x)")
+    # one pass to fill the records, the timed ones only look them up
+    for identifier, _paper in pages: memoized.parse_paper(identifier, _paper)
+    memoized.record_cache.flush()
+    records = time_per_paper(memoized.parse_paper, pages, args.repeat)
+    print(f"  memoized record: {records * 1e6:10.1f} us/paper ({before / records:0.2f}x)")
@@ -0,0 +1,231 @@
+# Local stand-in for the publishers, serving synthetic list pages, papers and
+# pdfs in the format every config expects, at the _url/_pdf addresses of the
+# configs. The corpus is generated from the paper number, so the same size
+# always gives the same pages.
+#
+#   python benchmarks/server.py --size 10000 --latency 0.01 --error-rate 0.01
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+import email.utils
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+WORDS = (
+    "touch tactile haptic physical hand gesture virtual reality augmented mixed selection manipulation "
+    "pointing interaction feedback display mobile wearable sensing input technique study evaluation "
+    "design system user interface immersive controller glove vibration force texture target"
+).split()
+NAMES = "ann lee bo kim carla diaz dan wu eve park finn berg gus ito hana sato ivan roth".split()
+
+def words(n, count, offset=0):
+    rng = random.Random(n * 7919 + offset)
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+def authors(n):
+    rng = random.Random(n)
+    return ["%s %s" % (rng.choice(NAMES), rng.choice(NAMES)) for _ in range(1 + n % 4)]
+
+def pdf(n):
+    # a small but complete pdf with 1 to 12 pages, xref and trailer included
+    pages = 1 + n % 12
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join("%d 0 R" % (3 + i) for i in range(pages)), pages)]
+    objects += ["<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>"] * pages
+    out, offsets = b"%PDF-1.4\n", []
+    for i, body in enumerate(objects):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i + 1, body.encode())
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+class Acm:
+    def identifier(self, n): return "10.1145/%d.%d" % (3000000 + n // 1000, n)
+    def number(self, identifier): return int(identifier.rsplit('.', 1)[1])
+    def list_page(self, query, size):
+        page, per_page = int(query.get('startPage', 0)), int(query.get('pageSize', 20))
+        items = "".join('<li><span class="hlFld-Title"><a href="/doi/%s">x</a></span></li>\n' % self.identifier(n) for n in range(page * per_page, min(size, (page + 1) * per_page)))
+        return '<html><span class="result__count">{:,} Results</span>\n{}</html>'.format(size, items)
+    def paper(self, n):
+        return (
+            '<html><h1 class="citation__title">%s</h1>\n' % words(n, 8).title()
+            + "".join('<div class="author-data"><span>%s</span></div>' % a for a in authors(n))
+            + "".join('\n<li><a href="/keyword/%s" title="%s" class="badge-type">%s</a></li>' % (w, w, w) for w in words(n, 3, 1).split())
+            + '\n<div class="abstractSection abstractInFull"><p>%s</p><!-- /abstract content -->' % words(n, 150, 2)
+            + '\n<div class="book-meta">CHI \'%02d</div>' % (n % 20)
+            + '\n<span class="citation"><i class="icon-quote"></i><span>%d</span>' % (n % 97)
+            + '\n<div class="flex-container"><span class="bold">ISBN:</span><span class="space">978-1-4503-%04d</span></div>' % (n % 10000)
+            + '\n<a href="https://doi.org/%s" class="issue-item__doi">https://doi.org/%s</a>' % (self.identifier(n), self.identifier(n))
+            + '\n<div class="section__separator"><h3 class="left-bordered-title">Publication History</h3><div class="section__content"><ul class="rlist"><li>Published: %d May 20%02d</li></ul></div></div>\n</html>' % (1 + n % 28, n % 20)
+        )
+
+class Ieee:
+    def identifier(self, n): return str(8000000 + n)
+    def number(self, identifier): return int(identifier) - 8000000
+    def list_page(self, query, size):
+        page, per_page = int(query.get('pageNumber', 1)), int(query.get('rowsPerPage', 25))
+        start = (page - 1) * per_page
+        return { 'totalRecords': size, 'records': [{ 'articleNumber': self.identifier(n) } for n in range(start, min(size, start + per_page))] }
+    def paper(self, n):
+        meta = {
+            'title': words(n, 8).title(), 'abstract': words(n, 150, 2), 'doi': "10.1109/VR.%d" % n,
+            'authors': [{ 'name': a } for a in authors(n)], 'keywords': [{ 'type': 'IEEE Keywords', 'kwd': words(n, 3, 1).split() }],
+            'publicationDate': "%d March 20%02d" % (1 + n % 28, n % 20), 'publicationTitle': "IEEE VR 20%02d" % (n % 20),
+            'metrics': { 'citationCountPaper': n % 97 }, 'isbn': [{ 'format': 'Print ISBN', 'value': "978-1-7281-%04d" % (n % 10000) }],
+        }
+        return "<html><script>global.document.metadata=%s;   </script></html>" % json.dumps(meta)
+
+class ScienceDirect:
+    def identifier(self, n): return "S10715819%08d" % n
+    def number(self, identifier): return int(identifier[len("S10715819"):])
+    def list_page(self, query, size):
+        offset, per_page = int(query.get('offset', 0)), int(query.get('show', 25))
+        items = "".join('<input type="checkbox" id="%s" class="checkbox-input select-result show-from-md checkbox-small" />\n' % self.identifier(n) for n in range(offset, min(size, offset + per_page)))
+        return '<html><span class="search-body-results-text">%d results</span>\n%s</html>' % (size, items)
+    def paper(self, n):
+        return (
+            '<html><meta name="citation_publication_date" content="20%02d/01/01" />\n' % (n % 20)
+            + '<meta name="citation_doi" content="10.1016/j.ijhcs.%d" />\n' % n
+            + '<a class="publication-title-link" title="IJHCS" href="/journal/ijhcs">International Journal of Human-Computer Studies</a>\n'
+            + '<span class="title-text">%s</span>\n' % words(n, 8).title()
+            + "".join('<a class="author size-m workspace-trigger" name="baep-author-id%d" href="#!"><span>%s</span></a>\n' % (i, a) for i, a in enumerate(authors(n)))
+            + '<h2 class="section-title u-h3 u-margin-l-top u-margin-xs-bottom">Abstract</h2><div><p>%s</p></div></div></div></html>' % words(n, 150, 2)
+        )
+
+class Springer:
+    def identifier(self, n): return "10.1007/s10055-%03d-%05d" % (n % 20, n)
+    def number(self, identifier): return int(identifier.rsplit('-', 1)[1])
+    def list_page(self, query, size, page=1):
+        per_page = 20
+        start = (page - 1) * per_page
+        items = "".join('<a class="title" href="/article/%s">x</a>\n' % self.identifier(n) for n in range(start, min(size, start + per_page)))
+        return '<html><h1 id="number-of-search-results-and-search-terms">\n  <strong>%d</strong></h1>\n%s</html>' % (size, items)
+    def paper(self, n):
+        return (
+            '<html><h1 class="c-article-title" data-test="article-title" data-article-title="" itemprop="name headline">%s</h1>\n' % words(n, 8).title()
+            + "".join('<a data-test="author-name" data-track="click" data-track-action="open author" data-track-label="link" href="#a%d" data-author-popup="a%d">%s</a>\n' % (i, i, a) for i, a in enumerate(authors(n)))
+            + '<a href="https://doi.org/%s" data-track="click" data-track-action="view doi" data-track-label="link" itemprop="sameAs">\n' % self.identifier(n)
+            + '<time datetime="20%02d-01-01" itemprop="datePublished">01 January 20%02d</time>\n' % (n % 20, n % 20)
+            + '<a data-test="journal-link" href="/journal/10055"><i data-test="journal-title">Virtual Reality</i></a>\n'
+            + '<div class="c-article-section__content" id="Abs1-content"><p>%s</p></div>\n' % words(n, 150, 2)
+            + "".join('<li class="c-article-subject-list__subject"><span itemprop="about">%s</span></li>\n' % w for w in words(n, 3, 1).split())
+            + '</html>'
+        )
+
+class TaylorAndFrancis:
+    def identifier(self, n): return "10.1080/10447318.%d" % n
+    def number(self, identifier): return int(identifier.rsplit('.', 1)[1])
+    def list_page(self, query, size):
+        page, per_page = int(query.get('startPage', 0)), int(query.get('pageSize', 20))
+        start = page * per_page
+        items = "".join('<input type="checkbox" name="%s" />\n' % self.identifier(n) for n in range(start, min(size, start + per_page)))
+        return '<html><p role="status">\n  <strong>%d-%d</strong> of <strong>%d</strong> results\n</p>\n%s</html>' % (start + 1, start + per_page, size, items)
+    def paper(self, n):
+        return (
+            '<html><h1><span class="NLM_article-title hlFld-title">%s</span></h1>\n' % words(n, 8).title()
+            + "".join('<span class="contribDegrees "><a class="entryAuthor" href="/author/%d">%s<span class="overlay">x</span></a></span>\n' % (i, a) for i, a in enumerate(authors(n)))
+            + '<div class="abstractSection abstractInFull"><p>%s</p></div>\n' % words(n, 150, 2)
+            + '<div class="value"> %d </div> <div class="title"> CrossRef citations to date </div>\n' % (n % 97)
+            + '<a href="https://doi.org/%s">\n' % self.identifier(n)
+            + '<div class="widget-body body body-none  body-compact-all"><div>Received 1 Jan</div><div>Published online: 3 Mar 20%02d</div></div>\n' % (n % 20)
+            + '<div class="title-container">\n  <span class="titleHeading">Journal</span>International Journal of Human-Computer Interaction</div></html>'
+        )
+
+PUBLISHERS = { 'acm': Acm(), 'ieee': Ieee(), 'sciencedirect': ScienceDirect(), 'springer': Springer(), 'tandf': TaylorAndFrancis() }
+# the path prefix of every config in its _url
+CONFIG_PUBLISHERS = { 'acm': 'acm', 'ieee': 'ieee', 'sciencedirect': 'sciencedirect', 'springer': 'springer', 'taylor_and_francis': 'tandf' }
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes, with nagle every response would wait for a delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, content_type="text/html; charset=utf-8", headers={}):
+        if isinstance(body, str): body = body.encode("utf-8")
+        if status == 200:
+            # the content never changes, so its checksum is a stable ETag for conditional requests
+            etag = '"%08x"' % zlib.crc32(body)
+            headers = { **headers, "ETag": etag, "Last-Modified": self.server.started }
+            if self.headers.get("If-None-Match") == etag: status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in headers.items(): self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, query):
+        server = self.server
+        if server.latency > 0: time.sleep(server.latency * (0.5 + server.random() if server.jitter else 1))
+        if server.error_rate > 0 and server.random() < server.error_rate:
+            if server.retry_after is None: return self.send(503, "<html>Service Unavailable</html>")
+            return self.send(429, "<html>Too Many Requests</html>", headers={ "Retry-After": "%g" % server.retry_after })
+        path = parse.unquote(parse.urlparse(self.path).path).strip('/')
+        name, _, rest = path.partition('/')
+        if name not in PUBLISHERS: return self.send(404, "")
+        publisher = PUBLISHERS[name]
+        if rest == '':
+            page = publisher.list_page(query, server.size)
+            if isinstance(page, dict): return self.send(200, json.dumps(page), "application/json")
+            return self.send(200, page)
+        if rest.startswith('search/page/'):
+            return self.send(200, publisher.list_page(query, server.size, int(rest[len('search/page/'):])))
+        pdf_request = rest.startswith('pdf/')
+        if pdf_request: rest = rest[len('pdf/'):]
+        try: n = publisher.number(rest)
+        except ValueError: return self.send(404, "")
+        if n < 0 or n >= server.size: return self.send(404, "")
+        if pdf_request: return self.send(200, pdf(n), "application/pdf")
+        return self.send(200, publisher.paper(n))
+
+    def do_GET(self):
+        self.handle_request(dict(parse.parse_qsl(parse.urlparse(self.path).query)))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try: query = json.loads(body) if body else {}
+        except ValueError: query = dict(parse.parse_qsl(body.decode("utf-8")))
+        self.handle_request(query)
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=8000, size=1000, latency=0.0, jitter=False, error_rate=0.0, seed=1, retry_after=None):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.retry_after = retry_after
+        self.started = email.utils.formatdate(time.time(), usegmt=True)
+        self.size = size
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def random(self):
+        with self.rng_lock:
+            return self.rng.random()
+
+def serve(port=8000, size=1000, latency=0.0, jitter=False, error_rate=0.0, seed=1, retry_after=None):
+    server = StandInServer(port, size, latency, jitter, error_rate, seed, retry_after)
+    print("Serving %d papers per publisher on http://localhost:%d/" % (size, port), flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per response')
+    parser.add_argument('--jitter', action='store_true', help='vary the latency between 0.5x and 1.5x')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--retry-after', type=float, default=None, help='answer errors with 429 and this Retry-After instead')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    serve(args.port, args.size, args.latency, args.jitter, args.error_rate, args.seed, args.retry_after)
@@ -0,0 +1,134 @@
+# End-to-end benchmarks against the local stand-in server (benchmarks/server.py).
+# For every corpus size and config it measures, in this order:
+#   cold     Fetcher.run with an empty cache, everything comes from the server
+#   warm     Fetcher.run again, everything comes from the cache
+#   parse    parse_paper over the cached pages on one core, without the memoized records
+#   rebuild  Fetcher.rebuild over the cache on a process pool
+#   export   export_results_to_csv of the result
+#   pdf      download_pdfs, downloading and counting the pages of every pdf
+# The numbers can be written to a json file and compared with an earlier one.
+#
+#   python benchmarks/suite.py --sizes 1000,10000 --configs acm,ieee --output after.json --compare before.json
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import server
+from finder import Fetcher
+
+CONFIGS = ['acm', 'ieee', 'sciencedirect', 'springer', 'taylor_and_francis']
+STAGES = ['cold', 'warm', 'parse', 'rebuild', 'export', 'pdf']
+# the _url keys of all configs point here
+PORT = 8000
+
+def start_server(size, latency, jitter, error_rate, retry_after):
+    process = multiprocessing.Process(target=server.serve, args=(PORT, size, latency, jitter, error_rate, 1, retry_after), daemon=True)
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", PORT), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise Exception("the stand-in server did not start on port %d" % PORT)
+
+def timed(fun):
+    # the fetcher prints and draws progress bars, none of that belongs in the numbers
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        tic = time.perf_counter()
+        fun()
+        return time.perf_counter() - tic
+
+def fetcher(config_name, cache_folder, args, **kwargs):
+    return Fetcher(
+        {}, name='bench', config_name=config_name, cache_folder=cache_folder, use_local_urls=True,
+        sleep_between_requests=args.sleep, show_progress=False, result_format=args.result_format,
+        **{ **json.loads(args.fetcher_kwargs), **kwargs }
+    )
+
+def parse_cached(f):
+    pages = [(key, f.from_cache('paper', key, f.paper_is_json)) for key in f.cache.keys('paper')]
+    return lambda: [f.parse_paper(key, _paper) for key, _paper in pages]
+
+def run_config(size, config_name, folder, args):
+    cache_folder = os.path.join(folder, 'cache')
+    rows = []
+    def record(stage, seconds, items):
+        rows.append({ 'size': size, 'config': config_name, 'stage': stage, 'seconds': seconds, 'items': items, 'rate': items / seconds if seconds > 0 else 0 })
+        print("%8d  %-20s %-8s %9.2fs %10.1f/s" % (size, config_name, stage, seconds, rows[-1]['rate']), flush=True)
+
+    f = fetcher(config_name, cache_folder, args)
+    if 'cold' in args.stages: record('cold', timed(f.run), size)
+    if 'warm' in args.stages: record('warm', timed(fetcher(config_name, cache_folder, args).run), size)
+    if 'parse' in args.stages:
+        parse = parse_cached(fetcher(config_name, cache_folder, args, record_cache=False))
+        record('parse', timed(parse), size)
+    if 'rebuild' in args.stages: record('rebuild', timed(lambda: f.rebuild(args.processes)), size)
+    if 'export' in args.stages:
+        record('export', timed(lambda: f.export_results_to_csv(file_path=os.path.join(folder, 'export.csv'), override=True)), size)
+    if 'pdf' in args.stages:
+        record('pdf', timed(lambda: f.download_pdfs(save_folder=os.path.join(folder, 'pdfs'), processes=args.processes)), size)
+    return rows
+
+def compare(rows, file_path):
+    with open(file_path, "r") as f:
+        before = { (r['size'], r['config'], r['stage']): r for r in json.load(f)['results'] }
+    print("", "compared to %s (>1 is faster now)" % file_path, sep="\n")
+    for row in rows:
+        old = before.get((row['size'], row['config'], row['stage']))
+        if old is None or row['seconds'] <= 0: continue
+        print("%8d  %-20s %-8s %6.2fx" % (row['size'], row['config'], row['stage'], old['seconds'] / row['seconds']))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000', help='comma separated corpus sizes, e.g. 1000,10000,100000')
+    parser.add_argument('--configs', default=",".join(CONFIGS))
+    parser.add_argument('--stages', default=",".join(STAGES))
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', action='store_true')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=None)
+    parser.add_argument('--sleep', type=float, default=0.0, help='sleep_between_requests for every config')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--result-format', default='json')
+    parser.add_argument('--fetcher-kwargs', default='{}', help='json object of extra Fetcher kwargs, e.g. {"pipeline": true}')
+    parser.add_argument('--work-folder', default=None, help='kept after the run, a temporary folder otherwise')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None)
+    args = parser.parse_args()
+    args.stages = args.stages.split(',')
+
+    # the configs are read relative to the repository root
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    work_folder = args.work_folder or tempfile.mkdtemp(prefix='finder-bench-')
+    rows = []
+    print("%8s  %-20s %-8s %10s %12s" % ('size', 'config', 'stage', 'time', 'papers'))
+    try:
+        for size in map(int, args.sizes.split(',')):
+            process = start_server(size, args.latency, args.jitter, args.error_rate, args.retry_after)
+            try:
+                for config_name in args.configs.split(','):
+                    folder = os.path.join(work_folder, str(size), config_name)
+                    shutil.rmtree(folder, ignore_errors=True)
+                    rows += run_config(size, config_name, folder, args)
+            finally:
+                process.terminate()
+                process.join()
+    finally:
+        if args.work_folder is None: shutil.rmtree(work_folder, ignore_errors=True)
+
+    if args.output is not None:
+        params = { k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'work_folder') }
+        with open(args.output, "w") as f:
+            json.dump({ 'params': params, 'results': rows }, f, indent=2)
+    if args.compare is not None: compare(rows, args.compare)
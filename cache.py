@@ -0,0 +1,401 @@
+import os
+import sys
+import glob
+import json
+import zlib
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import time
+import helpers as h
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+KIND_FOLDERS = { 'list': 'list', 'paper': 'papers' }
+
+def sqlite_path(cache_folder, config_name):
+    return "%s/%s/cache.sqlite" % (cache_folder, config_name)
+
+def encode_content(content):
+    if isinstance(content, (dict, list)):
+        content = json.dumps(content)
+    return content
+
+class FileCache:
+    def __init__(self, cache_folder, config_name):
+        self.cache_folder = cache_folder
+        self.config_name = config_name
+
+    def path(self, kind, key):
+        return "%s/%s/%s/%s.html" % (self.cache_folder, self.config_name, KIND_FOLDERS[kind], key)
+
+    def exists(self, kind, key):
+        return h.check_file_exists(self.path(kind, key))
+
+    def read(self, kind, key):
+        return h.read_file(self.path(kind, key))
+
+    def write(self, kind, key, content):
+        h.write_file(self.path(kind, key), encode_content(content))
+
+    def size(self, kind, key):
+        return os.path.getsize(self.path(kind, key))
+
+    def mtime(self, kind, key):
+        return os.path.getmtime(self.path(kind, key))
+
+    def remove(self, kind, key):
+        if h.check_file_exists(self.path(kind, key)): os.remove(self.path(kind, key))
+
+    def keys(self, kind):
+        folder = "%s/%s/%s/" % (self.cache_folder, self.config_name, KIND_FOLDERS[kind])
+        for path in glob.iglob(folder + "**/*.html", recursive=True):
+            yield os.path.relpath(path, folder)[:-len(".html")].replace(os.sep, "/")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class SQLiteCache:
+    def __init__(self, cache_folder, config_name, compression='zlib', batch_size=100):
+        if compression == 'zstd' and zstandard is None:
+            raise Exception("zstd compression needs the zstandard package")
+        self.cache_folder = cache_folder
+        self.config_name = config_name
+        self.compression = compression
+        self.batch_size = batch_size
+        self.pending = {}
+        self.lock = threading.RLock()
+        h.ensure_path_exists(self.path())
+        self.db = sqlite3.connect(self.path(), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, codec TEXT NOT NULL, content BLOB NOT NULL, "
+            "PRIMARY KEY (kind, key))"
+        )
+        self.db.commit()
+
+    def path(self):
+        return sqlite_path(self.cache_folder, self.config_name)
+
+    def compress(self, content):
+        data = content.encode('utf-8')
+        if self.compression == 'zstd': return zstandard.ZstdCompressor().compress(data)
+        if self.compression == 'zlib': return zlib.compress(data)
+        return data
+
+    def decompress(self, codec, data):
+        if codec == 'zstd':
+            if zstandard is None: raise Exception("reading zstd compressed pages needs the zstandard package")
+            data = zstandard.ZstdDecompressor().decompress(data)
+        elif codec == 'zlib':
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+
+    def exists(self, kind, key):
+        with self.lock:
+            if (kind, key) in self.pending: return True
+            row = self.db.execute("SELECT 1 FROM pages WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        return row is not None
+
+    def read(self, kind, key):
+        with self.lock:
+            if (kind, key) in self.pending: return self.pending[(kind, key)]
+            row = self.db.execute("SELECT codec, content FROM pages WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        if row is None: raise KeyError("%s %s is not cached" % (kind, key))
+        return self.decompress(row[0], row[1])
+
+    def write(self, kind, key, content):
+        with self.lock:
+            self.pending[(kind, key)] = encode_content(content)
+            if len(self.pending) >= self.batch_size: self.flush()
+
+    def size(self, kind, key):
+        with self.lock:
+            if (kind, key) in self.pending: return len(self.compress(self.pending[(kind, key)]))
+            row = self.db.execute("SELECT length(content) FROM pages WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        return row[0] if row is not None else 0
+
+    def mtime(self, kind, key):
+        # pages keep no time of their own, the database file tells when anything was last written to it
+        with self.lock:
+            if (kind, key) in self.pending: return time.time()
+        return os.path.getmtime(self.path())
+
+    def remove(self, kind, key):
+        with self.lock:
+            self.pending.pop((kind, key), None)
+            self.db.execute("DELETE FROM pages WHERE kind = ? AND key = ?", (kind, key))
+            self.db.commit()
+
+    def keys(self, kind):
+        self.flush()
+        with self.lock:
+            rows = self.db.execute("SELECT key FROM pages WHERE kind = ? ORDER BY key", (kind,)).fetchall()
+        return [row[0] for row in rows]
+
+    def flush(self):
+        with self.lock:
+            if len(self.pending) <= 0: return
+            rows = [
+                (kind, key, self.compression, self.compress(content))
+                for (kind, key), content in self.pending.items()
+            ]
+            self.db.executemany("INSERT OR REPLACE INTO pages (kind, key, codec, content) VALUES (?, ?, ?, ?)", rows)
+            self.db.commit()
+            self.pending = {}
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+class PdfStore:
+    # PDFs are stored once under their sha256, shared by all configs, and
+    # every per-config or exported file name is a link to that object.
+    def __init__(self, cache_folder, chunk_size=64 * 1024):
+        self.folder = "%s/pdfs" % cache_folder
+        self.chunk_size = chunk_size
+
+    def object_path(self, digest):
+        return "%s/%s/%s.pdf" % (self.folder, digest[:2], digest)
+
+    def save(self, response, link_path):
+        h.ensure_path_exists(self.folder, True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=self.folder)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    digest.update(chunk)
+                    f.write(chunk)
+            # mkstemp creates the file owner-only
+            os.chmod(tmp_path, 0o644)
+            object_path = self.object_path(digest.hexdigest())
+            if h.check_file_exists(object_path):
+                os.remove(tmp_path)
+            else:
+                h.ensure_path_exists(object_path)
+                os.replace(tmp_path, object_path)
+        except BaseException:
+            if h.check_file_exists(tmp_path): os.remove(tmp_path)
+            raise
+        h.link_file(object_path, link_path)
+        return link_path
+
+    def remove(self, link_path):
+        # removes one link, the object only goes with the last link to it
+        if not os.path.lexists(link_path): return
+        if os.path.islink(link_path): object_path = os.path.realpath(link_path)
+        elif h.check_file_exists(link_path): object_path = os.path.realpath(self.object_path(h.file_digest(link_path)))
+        else: object_path = None
+        os.remove(link_path)
+        if object_path is None or not h.check_file_exists(object_path): return
+        if os.stat(object_path).st_nlink > 1 or self.symlinked(object_path): return
+        os.remove(object_path)
+
+    def symlinked(self, object_path):
+        # symlinks do not show in st_nlink, they are only made in the pdf folders of the configs
+        for path in glob.iglob("%s/*/pdfs/*.pdf" % os.path.dirname(self.folder)):
+            if os.path.islink(path) and os.path.realpath(path) == object_path: return True
+        return False
+
+class CacheMeta:
+    # When every entry of a config's cache was fetched and last used, its size and the
+    # ETag/Last-Modified it came with, for the freshness policy and the size capped
+    # eviction. Kept in memory per kind and written back in batches.
+    def __init__(self, cache_folder, config_name, batch_size=500):
+        self.file_path = "%s/%s/meta.sqlite" % (cache_folder, config_name)
+        self.batch_size = batch_size
+        self.kinds = {}
+        self.sizes = {}
+        self.dirty = set()
+        self.removed = set()
+        self.lock = threading.RLock()
+        self.db = None
+
+    def open(self):
+        if self.db is not None: return self.db
+        h.ensure_path_exists(self.file_path)
+        self.db = sqlite3.connect(self.file_path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, fetched REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL, "
+            "etag TEXT, last_modified TEXT, PRIMARY KEY (kind, key))"
+        )
+        self.db.commit()
+        return self.db
+
+    def entries(self, kind):
+        with self.lock:
+            if kind not in self.kinds:
+                rows = self.open().execute("SELECT key, fetched, accessed, size, etag, last_modified FROM entries WHERE kind = ?", (kind,)).fetchall()
+                self.kinds[kind] = { row[0]: { 'fetched': row[1], 'accessed': row[2], 'size': row[3], 'etag': row[4], 'last_modified': row[5] } for row in rows }
+                self.sizes[kind] = sum(row[3] for row in rows)
+            return self.kinds[kind]
+
+    def get(self, kind, key):
+        with self.lock:
+            return self.entries(kind).get(key)
+
+    def update(self, kind, key, **fields):
+        with self.lock:
+            entries = self.entries(kind)
+            if key not in entries: entries[key] = { 'fetched': 0, 'accessed': 0, 'size': 0, 'etag': None, 'last_modified': None }
+            self.sizes[kind] += fields.get('size', entries[key]['size']) - entries[key]['size']
+            entries[key].update(fields)
+            self.dirty.add((kind, key))
+            self.removed.discard((kind, key))
+            if len(self.dirty) >= self.batch_size: self.flush()
+
+    def fetched(self, kind, key, size, headers={}):
+        now = time.time()
+        self.update(kind, key, fetched=now, accessed=now, size=size, etag=headers.get('etag'), last_modified=headers.get('last-modified'))
+
+    def touch(self, kind, key):
+        self.update(kind, key, accessed=time.time())
+
+    def remove(self, kind, key):
+        with self.lock:
+            entry = self.entries(kind).pop(key, None)
+            if entry is not None: self.sizes[kind] -= entry['size']
+            self.dirty.discard((kind, key))
+            self.removed.add((kind, key))
+
+    def total_size(self, kind):
+        with self.lock:
+            self.entries(kind)
+            return self.sizes[kind]
+
+    def oldest(self, kind):
+        # least recently used first
+        with self.lock:
+            return sorted(self.entries(kind).items(), key=lambda item: item[1]['accessed'])
+
+    def flush(self):
+        with self.lock:
+            if self.db is None or (len(self.dirty) <= 0 and len(self.removed) <= 0): return
+            rows = []
+            for kind, key in self.dirty:
+                e = self.kinds[kind][key]
+                rows.append((kind, key, e['fetched'], e['accessed'], e['size'], e['etag'], e['last_modified']))
+            self.db.executemany("INSERT OR REPLACE INTO entries (kind, key, fetched, accessed, size, etag, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.executemany("DELETE FROM entries WHERE kind = ? AND key = ?", list(self.removed))
+            self.db.commit()
+            self.dirty, self.removed = set(), set()
+
+def content_digest(content):
+    return hashlib.sha1(encode_content(content).encode('utf-8')).hexdigest()
+
+class RecordCache:
+    # The fields parsed out of a paper page, keyed by the digest of the raw page and
+    # a version, the digest of the config sections that parse it. An unchanged page
+    # is never preprocessed or parsed twice and a config edit misses exactly the
+    # records that edit can change. Finders of one config with different preprocessing
+    # have different versions and share the file, so rows of other versions stay until prune().
+    def __init__(self, cache_folder, config_name, version, batch_size=500):
+        self.file_path = "%s/%s/records.sqlite" % (cache_folder, config_name)
+        self.version = version
+        self.batch_size = batch_size
+        self.pending = {}
+        self.lock = threading.RLock()
+        self.db = None
+
+    def open(self):
+        if self.db is not None: return self.db
+        h.ensure_path_exists(self.file_path)
+        self.db = sqlite3.connect(self.file_path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "page TEXT NOT NULL, version TEXT NOT NULL, fields TEXT NOT NULL, PRIMARY KEY (page, version))"
+        )
+        self.db.commit()
+        return self.db
+
+    def get(self, page):
+        with self.lock:
+            if page in self.pending: return self.pending[page]
+            row = self.open().execute("SELECT fields FROM records WHERE page = ? AND version = ?", (page, self.version)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, page, fields):
+        with self.lock:
+            self.pending[page] = fields
+            if len(self.pending) >= self.batch_size: self.flush()
+
+    def flush(self):
+        with self.lock:
+            if len(self.pending) <= 0: return
+            rows = [(page, self.version, json.dumps(fields)) for page, fields in self.pending.items()]
+            self.open().executemany("INSERT OR REPLACE INTO records (page, version, fields) VALUES (?, ?, ?)", rows)
+            self.db.commit()
+            self.pending = {}
+
+    def prune(self, keep=()):
+        # drops the records of every version but this one and `keep`, returns how many went
+        versions = [self.version] + list(keep)
+        with self.lock:
+            cursor = self.open().execute("DELETE FROM records WHERE version NOT IN (%s)" % ",".join("?" * len(versions)), versions)
+            self.db.commit()
+        return cursor.rowcount
+
+def file_keys(folder, ext):
+    # the names of the files in one folder, without the extension
+    if not os.path.isdir(folder): return []
+    with os.scandir(folder) as entries:
+        return [entry.name[:-len(ext)] for entry in entries if entry.name.endswith(ext)]
+
+class Manifest:
+    # The keys of a cache held in memory, so that existence checks do not touch
+    # the disk. Each kind is read with one scan (or one query) on first use and
+    # is kept current by the writes and removals that go through add/discard.
+    def __init__(self, sources):
+        self.sources = sources
+        self.kinds = {}
+        self.lock = threading.Lock()
+
+    def keys(self, kind):
+        with self.lock:
+            if kind not in self.kinds: self.kinds[kind] = set(self.sources[kind]())
+            return self.kinds[kind]
+
+    def exists(self, kind, key):
+        return key in self.keys(kind)
+
+    def add(self, kind, key):
+        self.keys(kind).add(key)
+
+    def discard(self, kind, key):
+        self.keys(kind).discard(key)
+
+def open_cache(backend, cache_folder, config_name, **kwargs):
+    if backend == 'files': return FileCache(cache_folder, config_name)
+    if backend == 'sqlite': return SQLiteCache(cache_folder, config_name, **kwargs)
+    raise Exception("cache backend %s could not be found" % backend)
+
+def migrate(cache_folder, config_name, compression='zlib'):
+    source = FileCache(cache_folder, config_name)
+    target = SQLiteCache(cache_folder, config_name, compression, batch_size=500)
+    counts = {}
+    for kind in KIND_FOLDERS:
+        counts[kind] = 0
+        for key in source.keys(kind):
+            target.write(kind, key, source.read(kind, key))
+            counts[kind] += 1
+    target.close()
+    return counts
+
+if __name__ == "__main__":
+    # python cache.py migrate ./cache acm [zlib|zstd|none]
+    if len(sys.argv) < 4 or sys.argv[1] != 'migrate':
+        sys.exit("usage: python cache.py migrate <cache_folder> <config_name> [zlib|zstd|none]")
+    counts = migrate(sys.argv[2], sys.argv[3], *sys.argv[4:5])
+    print("Imported %d list pages and %d papers into %s" % (counts['list'], counts['paper'], sqlite_path(sys.argv[2], sys.argv[3])))
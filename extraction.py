@@ -0,0 +1,223 @@
+import re
+import os
+import helpers as h
+
+# paper fields and whether they hold a single item (True) or a unique list (False)
+PAPER_FIELDS = {
+    'title': True,
+    'authors': False,
+    'abstract': True,
+    'keywords': False,
+    'published_in': True,
+    'publication_date': True,
+    'citations': True,
+    'isbn': True,
+    'doi': True,
+}
+
+# part of the version of memoized records, raise it when a change here parses a page differently
+EXTRACTION_VERSION = 1
+
+# applied to the raw field value, whether it came from a regex or from json
+FORMATTERS = {
+    'authors': lambda authors: list(map(lambda s: s.title(), h.flatten(authors))),
+    'keywords': lambda keywords: h.flatten(keywords),
+}
+
+def clean_match(s):
+    return h.strip_html(s).replace("\n", " ").strip()
+
+def first_value(find):
+    if len(find) <= 0: return ''
+    f = find[0] if not isinstance(find[0], tuple) else find[0][0]
+    return clean_match(f)
+
+def unique_values(find):
+    return h.unique(map(clean_match, find))
+
+def unique_matches(pattern, html):
+    if pattern is None or pattern == '': return []
+    return unique_values(re.findall(pattern, html))
+
+def first_match(pattern, html):
+    if pattern is None or pattern == '': return ''
+    return first_value(re.findall(pattern, html))
+
+class StreamMatcher:
+    # unique_matches over text that arrives in pieces. A match is only taken once
+    # `margin` more characters arrived behind it, so that no later piece can change
+    # it, and the text before it is dropped; close() takes whatever is left.
+    def __init__(self, pattern, margin=4096):
+        self.regex = re.compile(pattern)
+        self.margin = margin
+        self.text = ''
+        self.seen = set()
+
+    def feed(self, piece):
+        self.text += piece
+        return self.scan(len(self.text) - self.margin)
+
+    def close(self):
+        return self.scan(len(self.text))
+
+    def scan(self, limit):
+        values, cut = [], 0
+        for m in self.regex.finditer(self.text):
+            if m.end() > limit:
+                cut = m.start()
+                break
+            cut = m.end()
+            value = clean_match(m.group(1) or '' if self.regex.groups > 0 else m.group(0))
+            if value in self.seen: continue
+            self.seen.add(value)
+            values.append(value)
+        else:
+            cut = max(cut, limit)
+        self.text = self.text[cut:]
+        return values
+
+def compile_pattern(pattern):
+    return re.compile(pattern) if pattern else None
+
+class RegexField:
+    def __init__(self, pattern, item=True):
+        self.pattern = compile_pattern(pattern)
+        self.item = item
+
+    def __call__(self, html):
+        return first_match(self.pattern, html) if self.item else unique_matches(self.pattern, html)
+
+class JsonField:
+    def __init__(self, path):
+        self.path = path
+        self.accessor = h.compile_path(path)
+
+    def __call__(self, d):
+        return self.accessor.get(d, '')
+
+# characters that end a plain literal prefix of a pattern
+REGEX_SPECIAL = set('\\.^$*+?{}[]|()')
+REGEX_QUANTIFIERS = set('*+?{')
+
+def has_top_level_alternation(pattern):
+    depth, in_class, escaped = 0, False, False
+    for c in pattern:
+        if escaped: escaped = False
+        elif c == '\\': escaped = True
+        elif in_class: in_class = c != ']'
+        elif c == '[': in_class = True
+        elif c == '(': depth += 1
+        elif c == ')': depth -= 1
+        elif c == '|' and depth == 0: return True
+    return False
+
+def literal_prefix(pattern):
+    if has_top_level_alternation(pattern): return ''
+    prefix = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            c, step = pattern[i + 1], 2
+        elif c in REGEX_SPECIAL:
+            break
+        else:
+            step = 1
+        # a quantifier applies to the character before it
+        if i + step < len(pattern) and pattern[i + step] in REGEX_QUANTIFIERS: break
+        prefix += c
+        i += step
+    return prefix
+
+def has_backreference(pattern):
+    return re.search(r'\\[1-9]|\(\?P=', pattern) is not None
+
+def match_value(m):
+    if m.re.groups == 0: return m.group(0)
+    if m.re.groups == 1: return m.group(1) or ''
+    return tuple(g or '' for g in m.groups())
+
+class SinglePassExtractor:
+    # Finds every regex field in one scan over the document. The scanner is
+    # an alternation of the literal prefixes of all field patterns, so it
+    # only stops where some field can start; each field is then matched at
+    # those offsets alone, replaying the findall() cursor per field so the
+    # results equal re_item/re_list. Fields without a usable literal prefix
+    # fall back to their own findall().
+    def __init__(self, fields):
+        self.fields = [(key, field) for key, field in fields.items() if field.pattern is not None]
+        self.combined_fields, self.separate = [], []
+        prefixes = []
+        for key, field in self.fields:
+            prefix = literal_prefix(field.pattern.pattern)
+            if prefix == '' or has_backreference(field.pattern.pattern):
+                self.separate.append((key, field))
+            else:
+                self.combined_fields.append((key, field))
+                prefixes.append(prefix)
+        self.scanner = None
+        if len(prefixes) > 0:
+            common = os.path.commonprefix(prefixes)
+            # longest first, so no prefix shadows a longer one it starts
+            rest = sorted(set(p[len(common):] for p in prefixes), key=len, reverse=True)
+            self.scanner = re.compile(re.escape(common) + "(?:%s)" % "|".join(map(re.escape, rest)))
+
+    def scan(self, html):
+        found = { key: [] for key, _ in self.fields }
+        cursors = { key: 0 for key, _ in self.combined_fields }
+        pending = [(key, field) for key, field in self.combined_fields]
+        pos = 0
+        while len(pending) > 0:
+            candidate = self.scanner.search(html, pos)
+            if candidate is None: break
+            start = candidate.start()
+            for key, field in pending:
+                if start < cursors[key]: continue
+                m = field.pattern.match(html, start)
+                if m is None: continue
+                found[key].append(match_value(m))
+                cursors[key] = m.end() if m.end() > start else start + 1
+            # item fields only need their first match
+            pending = [(key, field) for key, field in pending if not (field.item and len(found[key]) > 0)]
+            pos = start + 1
+        for key, field in self.separate:
+            found[key] = field.pattern.findall(html)
+        return found
+
+    def extract(self, html):
+        found = self.scan(html)
+        return {
+            key: first_value(found[key]) if field.item else unique_values(found[key])
+            for key, field in self.fields
+        }
+
+class ExtractionPlan:
+    def __init__(self, get_config, preprocessing_paper, single_pass=False):
+        self.is_pre_json = any(pre.get('type') == 'embedded_json' for pre in preprocessing_paper)
+        self.preprocessing = [
+            (pre['type'], compile_pattern(pre.get('regex', '')))
+            for pre in preprocessing_paper
+        ]
+        self.fields = {}
+        for key, item in PAPER_FIELDS.items():
+            if self.is_pre_json:
+                self.fields[key] = JsonField(get_config("json.paper.%s" % key))
+            else:
+                self.fields[key] = RegexField(get_config("regex.paper.%s" % key), item)
+        self.single_pass = SinglePassExtractor(self.fields) if single_pass and not self.is_pre_json else None
+
+    def format(self, key, value):
+        return FORMATTERS[key](value) if key in FORMATTERS else value
+
+    def extract(self, key, _paper):
+        return self.format(key, self.fields[key](_paper))
+
+    def extract_all(self, _paper):
+        if self.single_pass is None:
+            return { key: self.extract(key, _paper) for key in self.fields }
+        values = self.single_pass.extract(_paper)
+        # fields without a pattern never show up in the scan
+        return {
+            key: self.format(key, values[key] if key in values else self.fields[key](_paper))
+            for key in self.fields
+        }
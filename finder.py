@@ -1,20 +1,50 @@
 import requests
-from urllib import parse
-import re
 import pandas as pd
 import json
 import os
-import io
 import helpers as h
+import cache
+import pdfs
+import results
+import metrics
+import collections
+import itertools
+import codecs
+import queue
+import threading
+from journal import Journal, MISSING
+from extraction import EXTRACTION_VERSION, ExtractionPlan, StreamMatcher, first_match, unique_matches
+from query import compile_query, filter_papers
+from index import PaperIndex
 import math
 import time
-import progressbar
-import sys
-import PyPDF2
 import warnings
+import shutil
+import glob
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+try:
+    import brotli
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    # requests can only decode br responses when brotli is installed
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+class RequestFailed(Exception):
+    def __init__(self, url, reason, status=None):
+        super().__init__("%s: %s" % (url, reason))
+        self.url = url
+        self.status = status
+
+    @property
+    def retryable(self):
+        # no status means a timeout or a dropped connection
+        return self.status is None or self.status == 429 or self.status >= 500
 
 class Fetcher:
     def __init__(self, search_parameters={}, load_from='cache', **kwargs):
+        self.kwargs = kwargs
         self.load_from = load_from
         self.name = kwargs.get('name', 'finder')
         self.cache_folder = kwargs.get('cache_folder', './cache')
@@ -32,160 +62,388 @@ class Fetcher:
         self.list_is_json = self.get_config('urls.list.expect-json', False)
         self.paper_is_json = self.get_config('urls.paper.expect-json', False)
         self.per_page = self.get_config('urls.list.per-page')
+        # the _url/_pdf addresses of a config point at the local stand-in server of benchmarks/server.py
+        self.use_local_urls = kwargs.get('use_local_urls', False)
+        self.sleep_between_requests = kwargs.get('sleep_between_requests', self.get_config('sleep_between_requests', 0))
+        # sleep_between_requests is where the per host controller starts and, unless rate_control sets a smaller
+        # min_interval, the fastest it goes; it only slows down on errors, see h.AdaptiveRateLimiter for the options
+        self.rate_control = kwargs.get('rate_control', self.get_config('rate_control', {}))
+        self.max_retries = kwargs.get('max_retries', self.get_config('max_retries', 5))
+        self.timeout = kwargs.get('timeout', self.get_config('timeout', 60))
 
         self.preprocessing_paper = self.get_config("preprocessing.paper", []) + kwargs.get('preprocessing_paper', [])
         self.preprocessing_list = self.get_config("preprocessing.list", []) + kwargs.get('preprocessing_list', [])
         self.postprocessing_paper = self.get_config("postprocessing.paper", []) + kwargs.get('postprocessing_paper', [])
         self.postprocessing_list = self.get_config("postprocessing.list", []) + kwargs.get('postprocessing_list', [])
+        self.paper_filters = [
+            compile_query(post.get('query', {}), post.get('case_sensitive', True), post.get('match_mode', 'substring'))
+            for post in self.postprocessing_paper if post["type"] == "query"
+        ]
+        self.extraction = kwargs.get('extraction', self.get_config('extraction', 'per-field'))
+        self.extraction_plan = ExtractionPlan(self.get_config, self.preprocessing_paper, self.extraction == 'single-pass')
 
-        self.restrict_identifiers_to = kwargs.get('restrict_identifiers_to', [])
+        # the given order is kept for the targeted mode, every membership test goes through the set;
+        # identifiers read from a csv come as numbers, the lists and the cache keys know them as strings
+        self.target_identifiers = h.unique(map(str, kwargs.get('restrict_identifiers_to', [])))
+        self.restrict_identifiers_to = set(self.target_identifiers)
+        # targeted runs fetch exactly the restricted identifiers and never crawl the search lists
+        self.targeted = kwargs.get('targeted', False)
+        self.show_progress = kwargs.get('show_progress', True)
+        self.status = { 'pages': 0, 'total_pages': None, 'papers': 0 }
+        self.result_format = kwargs.get('result_format', 'json')
+        self.max_concurrency = kwargs.get('max_concurrency', self.get_config('max_concurrency', 1))
+        self.list_concurrency = kwargs.get('list_concurrency', self.get_config('list_concurrency', 1))
+        # one thread streams the list pages into a bounded queue of identifiers that the paper workers take from
+        self.pipeline = kwargs.get('pipeline', self.get_config('pipeline', False))
+        self.queue_size = kwargs.get('queue_size', self.get_config('queue_size', 4 * self.max_concurrency * self.list_concurrency))
+        self.pages_ahead = kwargs.get('pages_ahead', self.get_config('pages_ahead', 2))
+        self.pool_size = kwargs.get('pool_size', self.get_config('pool_size', max(10, self.max_concurrency * self.list_concurrency)))
+        self.session = self.create_session()
+        self.cache = cache.open_cache(
+            kwargs.get('cache_backend', self.get_config('cache.backend', 'files')),
+            self.cache_folder, self.config_name,
+            **kwargs.get('cache_options', self.get_config('cache.options', {}))
+        )
+        self.pdf_store = cache.PdfStore(self.cache_folder)
+        # per kind (list, paper, pdf): a ttl in seconds, revalidate with conditional requests, and max_bytes for the lru eviction
+        self.cache_policy = kwargs.get('cache_policy', self.get_config('cache.policy', {}))
+        self.cache_meta = cache.CacheMeta(self.cache_folder, self.config_name)
+        self.cache_meta_adopted = set()
+        self.eviction_lock = threading.Lock()
+        # parsed fields per raw page, so a warm run skips preprocessing and parsing of unchanged papers
+        self.record_cache = cache.RecordCache(self.cache_folder, self.config_name, self.record_version()) \
+            if kwargs.get('record_cache', self.get_config('cache.records', True)) else None
+        self.manifest = cache.Manifest({
+            'list': lambda: self.cache.keys('list'),
+            'paper': lambda: self.cache.keys('paper'),
+            'pdf': lambda: cache.file_keys(self.pdf_folder(), ".pdf")
+        })
+        self.journal = Journal(self.journal_file_name())
+        self.index = PaperIndex(self.index_file_name()) if kwargs.get('index', self.get_config('index', False)) else None
+        self.metrics = metrics.Metrics({ 'config': self.config_name, 'name': self.name })
+        # .prom for the prometheus text format, anything else is json
+        self.metrics_file = kwargs.get('metrics_file', self.get_config('metrics.file', None))
+        self.metrics_every = kwargs.get('metrics_every', self.get_config('metrics.every', None))
 
     @property
     def header_user_agent(self):
         return 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.89 Safari/537.36'
 
+    def list_cache_key(self, page):
+        return "%s/%s" % (self.name, 'page-%d' % page)
+
+    def paper_cache_key(self, identifier):
+        return h.safe_filename(identifier)
+
     def list_file_name(self, page):
-        return "%s/%s/list/%s/%s.html" % (self.cache_folder, self.config_name, self.name, 'page-%d' % page)
+        return "%s/%s/list/%s.html" % (self.cache_folder, self.config_name, self.list_cache_key(page))
 
     def paper_file_name(self, identifier):
-        safe_identifier = h.safe_filename(identifier)
-        return "%s/%s/papers/%s.html" % (self.cache_folder, self.config_name, safe_identifier)
+        return "%s/%s/papers/%s.html" % (self.cache_folder, self.config_name, self.paper_cache_key(identifier))
     
+    def pdf_folder(self):
+        return "%s/%s/pdfs" % (self.cache_folder, self.config_name)
+
     def pdf_file_name(self, identifier, only_filename=False):
         safe_identifier = h.safe_filename(identifier)
         filename = "%s.pdf" % safe_identifier
         if only_filename: return filename
-        return "%s/%s/pdfs/%s" % (self.cache_folder, self.config_name, filename)
+        return "%s/%s" % (self.pdf_folder(), filename)
 
     def result_file_name(self):
-        return "%s/%s/result_%s.json" % (self.cache_folder, self.config_name, self.name)
+        return "%s/%s/result_%s.%s" % (self.cache_folder, self.config_name, self.name, self.result_format)
+
+    def journal_file_name(self):
+        return "%s/%s/journal_%s.jsonl" % (self.cache_folder, self.config_name, self.name)
 
-    def url_get(self, url, payload={}, headers={}):
-        headers = { 'user-agent': self.header_user_agent, **headers }
-        return requests.get(h.url_base_with_path(url), headers=headers, params=payload)
+    def index_file_name(self):
+        return "%s/%s/index.sqlite" % (self.cache_folder, self.config_name)
+
+    def create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({
+            'user-agent': self.header_user_agent,
+            'accept-encoding': ACCEPT_ENCODING,
+            **self.headers
+        })
+        return session
+
+    def connection_stats(self):
+        stats = { 'requests': 0, 'new': 0 }
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                stats['requests'] += pool.num_requests
+                stats['new'] += pool.num_connections
+        stats['reused'] = stats['requests'] - stats['new']
+        return stats
+
+    def measure_http(self, url, request):
+        with self.metrics.timed('http', h.url_domain(url)) as m:
+            response = request()
+            m['bytes'] = len(response.content)
+        return response
+
+    def send(self, url, request, stream=False):
+        # every request waits its turn, 429, 5xx and timeouts are retried with a jittered backoff
+        # and slow the host down, any other error status is raised before it can reach the cache
+        limiter = self.rate_limiter(url)
+        adaptive = isinstance(limiter, h.AdaptiveRateLimiter)
+        for attempt in range(self.max_retries + 1):
+            self.wait_for_turn(url)
+            retry_after = None
+            try:
+                response = request() if stream else self.measure_http(url, request)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = RequestFailed(url, str(e))
+            else:
+                if response.status_code < 400:
+                    if adaptive: limiter.success()
+                    return response
+                response.close()
+                error = RequestFailed(url, "status %d" % response.status_code, response.status_code)
+                if not error.retryable: raise error
+                retry_after = h.retry_after_seconds(response.headers.get('retry-after'))
+            if adaptive: limiter.failure(retry_after)
+            if attempt == self.max_retries: raise error
+            with self.metrics.timed('backoff', h.url_domain(url)):
+                time.sleep(h.backoff_delay(attempt, self.rate_control.get('backoff_base', 0.5), self.rate_control.get('backoff_cap', 30)))
+
+    def url_get(self, url, payload={}, headers={}, stream=False):
+        return self.send(url, lambda: self.session.get(h.url_base_with_path(url), headers=headers, params=payload, stream=stream, timeout=self.timeout), stream)
 
     def url_post_json(self, url, payload={}, headers={}):
         headers = { 
-            'user-agent': self.header_user_agent,
             'accept': '*/*',
             'content-type': 'application/json',
-            **self.headers,
             **headers
         }
-        return requests.post(h.url_base_with_path(url), headers=headers, data=json.dumps(payload))
+        return self.send(url, lambda: self.session.post(h.url_base_with_path(url), headers=headers, data=json.dumps(payload), timeout=self.timeout))
 
-    def url_post(self, url, payload={}, headers={}):
+    def url_post(self, url, payload={}, headers={}, stream=False):
         headers = {
-            'user-agent': self.header_user_agent,
             'accept': '*/*',
             'content-type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            **self.headers,
             **headers
         }
-        return requests.post(h.url_base_with_path(url), headers=headers, data=payload)
-
-    def ensure_cache_folder_exists(self):
-        if not h.check_file_exists(self.cache_folder):
-            os.mkdir(self.cache_folder)
+        return self.send(url, lambda: self.session.post(h.url_base_with_path(url), headers=headers, data=payload, stream=stream, timeout=self.timeout), stream)
 
     def paper_file_exists(self, identifier):
-        return h.check_file_exists(self.paper_file_name(identifier))
+        return self.manifest.exists('paper', self.paper_cache_key(identifier))
 
     def pdf_file_exists(self, identifier):
-        return h.check_file_exists(self.pdf_file_name(identifier))
+        return self.manifest.exists('pdf', h.safe_filename(identifier))
 
     def list_file_exists(self, page):
-        return h.check_file_exists(self.list_file_name(page))
+        return self.manifest.exists('list', self.list_cache_key(page))
 
     def fetch_list(self, page):
         if (self.load_from == 'cache'):
-            if(self.list_file_exists(page)): return self.from_cache(self.list_file_name(page), self.list_is_json)
-            else: return self.from_url_list(page)
+            key = self.list_cache_key(page)
+            state = self.cache_state('list', key, self.list_file_exists(page))
+            self.metrics.cache_lookup('list', state == 'fresh')
+            if(state == 'fresh'):
+                self.cache_used('list', key)
+                return self.from_cache('list', key, self.list_is_json)
+            else: return self.from_url_list(page, self.validators('list', key) if state == 'stale' else {})
         elif (self.load_from == 'url'): return self.from_url_list(page)
         else: raise Exception("load_from could not be found")
 
     def fetch_paper(self, identifier):
         if (self.load_from == 'cache'):
-            if(self.paper_file_exists(identifier)): return self.from_cache(self.paper_file_name(identifier), self.paper_is_json)
-            else: return self.from_url_paper(identifier)
+            key = self.paper_cache_key(identifier)
+            state = self.cache_state('paper', key, self.paper_file_exists(identifier))
+            self.metrics.cache_lookup('paper', state == 'fresh')
+            if(state == 'fresh'):
+                self.cache_used('paper', key)
+                return self.from_cache('paper', key, self.paper_is_json)
+            else: return self.from_url_paper(identifier, self.validators('paper', key) if state == 'stale' else {})
         elif (self.load_from == 'url'): return self.from_url_paper(identifier)
         else: raise Exception("load_from could not be found")
 
     def fetch_pdf(self, identifier):
         if (self.load_from == 'cache'):
-            if(self.pdf_file_exists(identifier)): 
-                with open(self.pdf_file_name(identifier), "rb") as f: return f.read()
-            else: return self.from_url_pdf(identifier)
+            key = h.safe_filename(identifier)
+            state = self.cache_state('pdf', key, self.pdf_file_exists(identifier))
+            self.metrics.cache_lookup('pdf', state == 'fresh')
+            if(state == 'fresh'):
+                self.cache_used('pdf', key)
+                return self.pdf_file_name(identifier)
+            else: return self.from_url_pdf(identifier, self.validators('pdf', key) if state == 'stale' else {})
         elif (self.load_from == 'url'): return self.from_url_pdf(identifier)
         else: raise Exception("load_from could not be found")
 
-    def from_cache(self, path, is_json):
-        html = h.read_file(path)
+    def paper_is_fresh(self, identifier):
+        return self.cache_state('paper', self.paper_cache_key(identifier), self.paper_file_exists(identifier)) == 'fresh'
+
+    def cache_state(self, kind, key, exists):
+        # missing, fresh, or stale once older than the ttl of the kind's policy
+        if not exists: return 'missing'
+        ttl = self.cache_policy.get(kind, {}).get('ttl')
+        if ttl is None: return 'fresh'
+        entry = self.cache_meta.get(kind, key)
+        if entry is None: entry = self.adopt(kind, key)
+        return 'fresh' if time.time() - entry['fetched'] < ttl else 'stale'
+
+    def validators(self, kind, key):
+        # conditional request headers, a page that did not change comes back as a 304 without a body
+        if not self.cache_policy.get(kind, {}).get('revalidate', False): return {}
+        entry = self.cache_meta.get(kind, key)
+        if entry is None: return {}
+        headers = {}
+        if entry['etag']: headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']: headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def cache_used(self, kind, key):
+        if self.cache_policy.get(kind, {}).get('max_bytes') is not None: self.cache_meta.touch(kind, key)
+
+    def cache_revalidated(self, kind, key):
+        now = time.time()
+        self.cache_meta.update(kind, key, fetched=now, accessed=now)
+
+    def cache_stored(self, kind, key, response=None):
+        if len(self.cache_policy.get(kind, {})) <= 0: return
+        self.cache_meta.fetched(kind, key, self.cached_size(kind, key), response.headers if response is not None else {})
+        self.evict(kind)
+
+    def evict(self, kind):
+        # least recently used entries go once the kind holds more than max_bytes, down to 90% of it
+        max_bytes = self.cache_policy.get(kind, {}).get('max_bytes')
+        if max_bytes is None: return
+        with self.eviction_lock:
+            if kind not in self.cache_meta_adopted:
+                for key in list(self.manifest.keys(kind)):
+                    if self.cache_meta.get(kind, key) is None: self.adopt(kind, key)
+                self.cache_meta_adopted.add(kind)
+            if self.cache_meta.total_size(kind) <= max_bytes: return
+            total = self.cache_meta.total_size(kind)
+            for key, entry in self.cache_meta.oldest(kind):
+                if total <= max_bytes * 0.9: break
+                self.remove_cached(kind, key)
+                total -= entry['size']
+
+    def adopt(self, kind, key):
+        # an entry cached before there was a policy counts as fetched and last used when it was written
+        mtime = self.cached_mtime(kind, key)
+        self.cache_meta.update(kind, key, fetched=mtime, accessed=mtime, size=self.cached_size(kind, key))
+        return self.cache_meta.get(kind, key)
+
+    def evict_all(self):
+        # a cap on a cache that is already larger takes effect before the run, not only after its next write
+        for kind, policy in self.cache_policy.items():
+            if policy.get('max_bytes') is not None: self.evict(kind)
+
+    def cached_mtime(self, kind, key):
+        if kind == 'pdf': return os.path.getmtime("%s/%s.pdf" % (self.pdf_folder(), key))
+        return self.cache.mtime(kind, key)
+
+    def cached_size(self, kind, key):
+        if kind == 'pdf': return os.path.getsize("%s/%s.pdf" % (self.pdf_folder(), key))
+        return self.cache.size(kind, key)
+
+    def remove_cached(self, kind, key):
+        if kind == 'pdf': self.pdf_store.remove("%s/%s.pdf" % (self.pdf_folder(), key))
+        else: self.cache.remove(kind, key)
+        self.manifest.discard(kind, key)
+        self.cache_meta.remove(kind, key)
+
+    def from_cache(self, kind, key, is_json):
+        with self.metrics.timed('cache_read') as m:
+            html = self.cache.read(kind, key)
+            m['bytes'] = len(html) if isinstance(html, str) else 0
         should_not_be_decoded = not is_json or isinstance(html, dict)
         return html if should_not_be_decoded else json.loads(html)
     
-    def from_url_pdf(self, identifier):
-        sleep_for = self.get_config('sleep_between_requests')
-        r = requests.get(self.pdf_url(identifier))
-        file_name = self.pdf_file_name(identifier)
-        h.ensure_path_exists(file_name)
-        with open(file_name, "wb") as f: f.write(r.content)
-        time.sleep(sleep_for)
-        return r.content
-
-    def from_url_list(self, page):
-        sleep_for = self.get_config('sleep_between_requests')
-        html = self.fetch_list_from_url(page)
-        h.write_file(self.list_file_name(page), html)
+    def rate_limiter(self, url):
+        options = { 'adaptive': True, **{ k: v for k, v in self.rate_control.items() if k not in ('backoff_base', 'backoff_cap') } }
+        return h.rate_limiter(h.url_domain(url), self.sleep_between_requests, **options)
+
+    def wait_for_turn(self, url):
+        with self.metrics.timed('wait', h.url_domain(url)):
+            self.rate_limiter(url).acquire()
+
+    def from_url_pdf(self, identifier, headers={}):
+        url = self.pdf_url(identifier)
+        key = h.safe_filename(identifier)
+        with self.metrics.timed('pdf_download', h.url_domain(url)) as m:
+            with self.send(url, lambda: self.session.get(url, headers=headers, stream=True, timeout=self.timeout), stream=True) as r:
+                if r.status_code == 304:
+                    self.cache_revalidated('pdf', key)
+                    return self.pdf_file_name(identifier)
+                path = self.pdf_store.save(r, self.pdf_file_name(identifier))
+            m['bytes'] = os.path.getsize(path)
+        self.manifest.add('pdf', key)
+        self.cache_stored('pdf', key, r)
+        return path
+
+    def to_cache(self, kind, key, html, response=None):
+        with self.metrics.timed('cache_write') as m:
+            self.cache.write(kind, key, html)
+            m['bytes'] = len(html) if isinstance(html, str) else 0
+        self.manifest.add(kind, key)
+        self.cache_stored(kind, key, response)
+
+    def from_url_list(self, page, headers={}):
+        key = self.list_cache_key(page)
+        html, response = self.fetch_list_from_url(page, headers)
+        if response.status_code == 304:
+            self.cache_revalidated('list', key)
+            return self.from_cache('list', key, self.list_is_json)
+        self.to_cache('list', key, html, response)
         shouldNotBeDecoded = not self.list_is_json or isinstance(html, dict)
-        time.sleep(sleep_for)
         return html if shouldNotBeDecoded else json.loads(html)
 
-    def from_url_paper(self, identifier):
-        sleep_for = self.get_config('sleep_between_requests')
-        html = self.fetch_paper_from_url(identifier)
-        h.write_file(self.paper_file_name(identifier), html)
+    def from_url_paper(self, identifier, headers={}):
+        key = self.paper_cache_key(identifier)
+        html, response = self.fetch_paper_from_url(identifier, headers)
+        if response.status_code == 304:
+            self.cache_revalidated('paper', key)
+            return self.from_cache('paper', key, self.paper_is_json)
+        self.to_cache('paper', key, html, response)
         shouldNotBeDecoded = not self.paper_is_json or isinstance(html, dict)
-        time.sleep(sleep_for)
         return html if shouldNotBeDecoded else json.loads(html)
     
     def re_list(self, pattern, html):
-        if len(pattern) == '': return []
-        return h.unique(map(
-            lambda s: h.strip_html(s).replace("\n", " ").strip(),
-            re.findall(pattern, html)
-        ))
+        return unique_matches(pattern, html)
     
     def re_item(self, pattern, html):
-        if len(pattern) == '': return ''
-        find = re.findall(pattern, html)
-        if len(find) <= 0: return ''
-        f = find[0] if not isinstance(find[0], tuple) else find[0][0]
-        return h.strip_html(f).replace("\n", " ").strip()
+        return first_match(pattern, html)
 
     def get_config(self, field, default=''):
-        try: return h.get_dict_field(self.config, field)
+        try: return h.compile_path(field).get(self.config)
         except ValueError: return default
 
+    def url_config(self, field):
+        if self.use_local_urls:
+            head, _, last = field.rpartition('.')
+            local = self.get_config("%s._%s" % (head, last))
+            if local != '': return local
+        return self.get_config(field)
+
     def list_url(self, page):
-        return h.insert_identifier(self.get_config("urls.list.url"), page, "page")
+        return h.insert_identifier(self.url_config("urls.list.url"), page, "page")
     
     def paper_url(self, identifier):
-        return h.insert_identifier(self.get_config("urls.paper.url"), identifier)
+        return h.insert_identifier(self.url_config("urls.paper.url"), identifier)
 
     def pdf_url(self, identifier):
-        return h.insert_identifier(self.get_config("urls.pdf"), identifier)
+        return h.insert_identifier(self.url_config("urls.pdf"), identifier)
 
     def identifiers(self, _list):
         if self.list_is_json:
-            return h.get_dict_field(_list, self.get_config('json.list.identifiers'))
+            return h.compile_path(self.get_config('json.list.identifiers')).get(_list)
         else:
             pattern = self.get_config("regex.list.identifiers")
             return self.re_list(pattern, _list)
     
     def total_number_of_results(self, _list):
         if self.list_is_json:
-            scount = h.get_dict_field(_list, self.get_config('json.list.total_number_of_results'))
+            scount = h.compile_path(self.get_config('json.list.total_number_of_results')).get(_list)
         else:
             pattern = self.get_config("regex.list.total_number_of_results")
             scount = self.re_item(pattern, _list)
@@ -194,8 +452,9 @@ class Fetcher:
         except ValueError: count = 0
         return count
 
-    def fetch_list_from_url(self, page):
-        payload = self.search_parameters
+    def list_request(self, page):
+        # list pages may be fetched from several threads, never mutate the shared search parameters
+        payload = dict(self.search_parameters)
 
         per_page_param = self.get_config("urls.list.params.per-page", "")
         if not per_page_param == "": payload[per_page_param] = self.per_page
@@ -206,36 +465,72 @@ class Fetcher:
                 page = page * payload[per_page_param]
             payload[page_param] = page
 
-        method = self.get_config("urls.list.method", "GET")
-        url = self.list_url(page)
+        return self.list_url(page), self.get_config("urls.list.method", "GET"), payload
+
+    def fetch_list_from_url(self, page, headers={}):
+        # the content, None for a 304, and the response for its status and validators
+        url, method, payload = self.list_request(page)
         if method == "GET":
-            return self.url_get(url, payload).text
+            response, content = self.url_get(url, payload, headers), lambda r: r.text
         elif method == "POST" and not self.get_config('urls.list.send-json', False):
-            return self.url_post(url, payload).text
+            response, content = self.url_post(url, payload, headers), lambda r: r.text
         else:
-            return self.url_post_json(url, payload).json()
+            response, content = self.url_post_json(url, payload, headers), lambda r: r.json()
+        return (None if response.status_code == 304 else content(response)), response
+
+    def stream_list(self, page, found):
+        # fetch_list, but found() gets the identifiers while the response is still coming in. html
+        # lists fetched with GET or a form POST are streamed, anything else is matched once complete.
+        url, method, payload = self.list_request(page)
+        streamable = not self.list_is_json and (method == "GET" or (method == "POST" and not self.get_config('urls.list.send-json', False)))
+        # a stale page may come back as a 304, only pages that were never cached are streamed
+        if not streamable or (self.load_from == 'cache' and self.list_file_exists(page)):
+            _list = self.preprocess_list(self.fetch_list(page))
+            found(self.identifiers(_list))
+            return _list
+        if self.load_from == 'cache': self.metrics.cache_lookup('list', False)
+        elif self.load_from != 'url': raise Exception("load_from could not be found")
 
-    def fetch_paper_from_url(self, identifier):
+        matcher = StreamMatcher(self.get_config("regex.list.identifiers"))
+        request = self.url_get if method == "GET" else self.url_post
+        with self.metrics.timed('http', h.url_domain(url)) as m:
+            with request(url, payload, stream=True) as r:
+                if r.encoding is None:
+                    # requests guesses the encoding from the whole body
+                    html = r.text
+                    found(matcher.feed(html) + matcher.close())
+                else:
+                    decoder = codecs.getincrementaldecoder(r.encoding)(errors='replace')
+                    pieces = []
+                    for chunk in r.iter_content(chunk_size=64 * 1024):
+                        pieces.append(decoder.decode(chunk))
+                        found(matcher.feed(pieces[-1]))
+                    pieces.append(decoder.decode(b'', final=True))
+                    found(matcher.feed(pieces[-1]) + matcher.close())
+                    html = ''.join(pieces)
+            m['bytes'] = len(html)
+        self.to_cache('list', self.list_cache_key(page), html, r)
+        return self.preprocess_list(html)
+
+    def fetch_paper_from_url(self, identifier, headers={}):
+        # like fetch_list_from_url
         method = self.get_config("urls.paper.method", "GET")
         if method == "GET":
-            return self.url_get(self.paper_url(identifier)).text
+            response, content = self.url_get(self.paper_url(identifier), headers=headers), lambda r: r.text
         elif method == "POST" and not self.list_is_json:
-            return self.url_post(self.paper_url(identifier)).text
+            response, content = self.url_post(self.paper_url(identifier), headers=headers), lambda r: r.text
         else:
-            return self.url_post_json(self.paper_url(identifier)).json()
+            response, content = self.url_post_json(self.paper_url(identifier), headers=headers), lambda r: r.json()
+        return (None if response.status_code == 304 else content(response)), response
 
-    def from_paper(self, key, _paper, item=True, default=''):
-        fun = self.re_item if item else self.re_list
-        is_pre_json = 'embedded_json' in self.get_config("preprocessing.paper.*.type", [])
-        return fun(self.get_config("regex.paper.%s" % key, default=default), _paper) \
-            if not is_pre_json else \
-            h.get_dict_field(_paper, self.get_config("json.paper.%s" % key), '')
+    def from_paper(self, key, _paper):
+        return self.extraction_plan.extract(key, _paper)
 
     def authors(self, _paper):
-        return list(map(lambda s: s.title(), h.flatten(self.from_paper("authors", _paper, False))))
+        return self.from_paper("authors", _paper)
 
     def keywords(self, _paper):
-        return h.flatten(self.from_paper("keywords", _paper, False))
+        return self.from_paper("keywords", _paper)
 
     def title(self, _paper):
         return self.from_paper("title", _paper)
@@ -262,10 +557,10 @@ class Fetcher:
         return "https://doi.org/%s" % self.doi(_paper)
 
     def preprocess_paper(self, _paper):
-        if len(self.preprocessing_paper) > 0:
-            for pre in self.preprocessing_paper:
-                if pre["type"] == "embedded_json":
-                    raw_paper = self.re_item(pre['regex'], _paper)
+        with self.metrics.timed('preprocess'):
+            for pre_type, pattern in self.extraction_plan.preprocessing:
+                if pre_type == "embedded_json":
+                    raw_paper = self.re_item(pattern, _paper)
                     _paper = json.loads(raw_paper)
         return _paper
     
@@ -276,174 +571,753 @@ class Fetcher:
         return _list
 
     def postprocess_paper(self, paper):
-        if len(self.postprocessing_paper) > 0:
-            for i, post in enumerate(self.postprocessing_paper):
-                if post["type"] == "query":
-                    query = h.get_dict_field(self.postprocessing_paper, f"{i}.query", {})
-                    f = h.analyze_query(paper, query)
-                    paper = paper if f else None
+        with self.metrics.timed('postprocess'):
+            for f in self.paper_filters:
+                if paper is None: break
+                paper = paper if f(paper) else None
         return paper
+
+    def postprocess_papers(self, papers):
+        for f in self.paper_filters:
+            papers = filter_papers(papers, f)
+        return papers
     
     def parse_paper(self, identifier, _paper):
-        _paper = self.preprocess_paper(_paper)
+        with self.metrics.timed('parse'):
+            paper = self.extract_paper(identifier, _paper)
+        # the index keeps every parsed paper, the filters are applied when searching it
+        if self.index is not None: self.index.add(paper)
+        paper = self.postprocess_paper(paper)
+        return paper
+
+    def record_version(self):
+        # only what decides the parsed fields, an edit anywhere else in the config keeps the records
+        sections = {
+            'extraction': EXTRACTION_VERSION,
+            'preprocessing': self.preprocessing_paper,
+            'fields': self.get_config('json.paper' if self.extraction_plan.is_pre_json else 'regex.paper', {})
+        }
+        return cache.content_digest(json.dumps(sections, sort_keys=True))
+
+    def extract_fields(self, _paper):
+        if self.record_cache is None: return self.extraction_plan.extract_all(self.preprocess_paper(_paper))
+        page = cache.content_digest(_paper)
+        fields = self.record_cache.get(page)
+        self.metrics.cache_lookup('record', fields is not None)
+        if fields is None:
+            fields = self.extraction_plan.extract_all(self.preprocess_paper(_paper))
+            self.record_cache.put(page, fields)
+        return fields
+
+    def prune_records(self, keep=()):
+        # memoized records of earlier config versions, kept until asked, since another finder
+        # of this config with its own preprocessing uses the same file
+        if self.record_cache is None: return 0
+        return self.record_cache.prune(keep)
+
+    def flush_caches(self):
+        self.cache.flush()
+        self.cache_meta.flush()
+        if self.record_cache is not None: self.record_cache.flush()
+
+    def extract_paper(self, identifier, _paper):
+        fields = self.extract_fields(_paper)
         paper = {
-            'title': self.title(_paper),
-            'authors': self.authors(_paper),
-            'abstract': self.abstract(_paper),
-            'keywords': self.keywords(_paper),
-            'published_in': self.published_in(_paper),
-            'publication_date': self.publication_date(_paper),
-            'citations': self.citations(_paper),
-            'isbn': self.isbn(_paper),
-            'doi': self.doi(_paper),
-            'doi_url': self.doi_url(_paper),
+            'title': fields['title'],
+            'authors': fields['authors'],
+            'abstract': fields['abstract'],
+            'keywords': fields['keywords'],
+            'published_in': fields['published_in'],
+            'publication_date': fields['publication_date'],
+            'citations': fields['citations'],
+            'isbn': fields['isbn'],
+            'doi': fields['doi'],
+            'doi_url': "https://doi.org/%s" % fields['doi'],
             'pdf_url': self.pdf_url(identifier),
             'pdf_file_name': self.pdf_file_name(identifier, True),
             'paper_url': self.paper_url(identifier),
             'identifier': identifier
         }
-        paper = self.postprocess_paper(paper)
         return paper
 
-    def fetch_parse_papers(self, identifiers):
-        sub = h.get_progressbar(len(identifiers))
-        sub.start()
-        papers = []
-        for i, identifier in enumerate(identifiers):
-            sub.update(i)
-            if len(self.restrict_identifiers_to) > 0 and identifier not in self.restrict_identifiers_to: continue
+    def fetch_parse_paper(self, identifier):
+        paper = self.journal.get_paper(identifier)
+        if paper is not MISSING: return paper
+        try:
             _paper = self.fetch_paper(identifier)
-            paper = self.parse_paper(identifier, _paper)
-            if paper is not None:
-                papers.append(paper)
-        sub.finish()
-        return papers
+        except RequestFailed as e:
+            # a paper the publisher refuses for good is skipped, it stays out of the journal so a resume asks again
+            if e.retryable: raise
+            print(f"\nFetching paper failed: id {identifier}, {e}")
+            return None
+        paper = self.parse_paper(identifier, _paper)
+        self.journal.paper_done(identifier, paper)
+        return paper
 
-    def fetch_parse_list(self, page):
+    def fetch_parse_papers(self, identifiers, show_progress=True):
+        if len(self.restrict_identifiers_to) > 0:
+            identifiers = [i for i in identifiers if i in self.restrict_identifiers_to]
+        if show_progress:
+            sub = h.get_progressbar(len(identifiers))
+            sub.start()
+        if self.max_concurrency > 1:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                futures = [pool.submit(self.fetch_parse_paper, identifier) for identifier in identifiers]
+                for i, _ in enumerate(as_completed(futures)):
+                    if show_progress: sub.update(i + 1)
+                # keep list order, not completion order
+                papers = [future.result() for future in futures]
+        else:
+            papers = []
+            for i, identifier in enumerate(identifiers):
+                if show_progress: sub.update(i)
+                papers.append(self.fetch_parse_paper(identifier))
+        if show_progress: sub.finish()
+        return [paper for paper in papers if paper is not None]
+
+    def fetch_parse_list(self, page, show_progress=True):
         _list = self.fetch_list(page)
         _list = self.preprocess_list(_list)
         identifiers = self.identifiers(_list)
-        return _list, self.fetch_parse_papers(identifiers)
+        # fetch_parse_page forgets them once the page is yielded
+        self.journal.hold(identifiers)
+        papers = self.fetch_parse_papers(identifiers, show_progress)
+        self.journal.page_done(page, self.total_number_of_results(_list), identifiers)
+        return _list, papers
+
+    def fetch_parse_page(self, page, show_progress=True):
+        if self.pipeline: return list(self.iter_pipeline([page]))[0]
+        # every page holds its identifiers once, forget releases that hold
+        if page not in self.journal.pages: self.fetch_parse_list(page, show_progress)
+        else: self.journal.hold(self.journal.pages[page]['identifiers'])
+        record = self.journal.pages[page]
+        papers = self.journal.page_papers(page)
+        self.journal.forget(record['identifiers'])
+        return record['total_results'], papers
+
+    def iter_pipeline(self, pages):
+        # The list pages are read in order by one thread, which queues (page, identifier) as soon as an
+        # identifier is matched in the incoming response. The queue is bounded and the reader stays at most
+        # pages_ahead pages in front of the page being yielded, so memory stays bounded. Pages are yielded
+        # in page order, as (total_results, papers) once all of their papers are parsed.
+        work = queue.Queue(maxsize=self.queue_size)
+        done = threading.Condition()
+        stop = threading.Event()
+        state = { 'lists': {}, 'papers': {}, 'queued': collections.defaultdict(set), 'yielded': -1, 'error': None }
+        wanted = lambda identifier: len(self.restrict_identifiers_to) <= 0 or identifier in self.restrict_identifiers_to
+
+        def fail(e):
+            with done:
+                if state['error'] is None: state['error'] = e
+                done.notify_all()
+            stop.set()
+
+        def put(item):
+            while not stop.is_set():
+                try: return work.put(item, timeout=0.1)
+                except queue.Full: pass
+
+        def queue_page(page, identifiers):
+            for identifier in identifiers:
+                if not wanted(identifier) or identifier in state['queued'][page]: continue
+                state['queued'][page].add(identifier)
+                # released when the page is yielded, so an earlier page with the same paper does not drop it
+                self.journal.hold([identifier])
+                put((page, identifier))
+
+        def read_lists():
+            try:
+                for n, page in enumerate(pages):
+                    with done:
+                        while n - state['yielded'] > self.pages_ahead and not stop.is_set(): done.wait()
+                    if stop.is_set(): return
+                    if page in self.journal.pages:
+                        record = None
+                    else:
+                        _list = self.stream_list(page, lambda identifiers: queue_page(page, identifiers))
+                        identifiers = self.identifiers(_list)
+                        # the complete list decides, whatever the stream matched differently is queued now
+                        queue_page(page, identifiers)
+                        record = (self.total_number_of_results(_list), identifiers)
+                    with done:
+                        state['lists'][page] = record
+                        done.notify_all()
+            except BaseException as e:
+                fail(e)
+            finally:
+                for _ in workers: put(None)
+
+        def fetch_papers():
+            while not stop.is_set():
+                try: item = work.get(timeout=0.1)
+                except queue.Empty: continue
+                if item is None: return
+                try: paper = self.fetch_parse_paper(item[1])
+                except BaseException as e: return fail(e)
+                with done:
+                    # a page that was already yielded does not wait for identifiers only the stream matched
+                    if item[0] in state['queued']: state['papers'][item] = paper
+                    done.notify_all()
+
+        def ready(page):
+            if page not in state['lists']: return False
+            record = state['lists'][page]
+            return record is None or all((page, i) in state['papers'] for i in record[1] if wanted(i))
+
+        # the same number of papers in flight as list_concurrency pages with max_concurrency papers each
+        workers = [threading.Thread(target=fetch_papers, daemon=True) for _ in range(max(1, self.max_concurrency * self.list_concurrency))]
+        reader = threading.Thread(target=read_lists, daemon=True)
+        for thread in workers + [reader]: thread.start()
+        try:
+            for n, page in enumerate(pages):
+                with done:
+                    while state['error'] is None and not ready(page): done.wait()
+                    if state['error'] is not None: raise state['error']
+                    record = state['lists'].pop(page)
+                    queued = state['queued'].pop(page, set())
+                    papers = { i: state['papers'].pop((page, i), None) for i in queued }
+                if record is None:
+                    # finished by an earlier run
+                    record = self.journal.pages[page]
+                    self.journal.hold(record['identifiers'])
+                    page_papers = self.journal.page_papers(page)
+                    self.journal.forget(record['identifiers'])
+                    total_results = record['total_results']
+                else:
+                    total_results, identifiers = record
+                    self.journal.page_done(page, total_results, identifiers)
+                    page_papers = [papers[i] for i in identifiers if papers.get(i) is not None]
+                    self.journal.forget(queued)
+                with done:
+                    state['yielded'] = n
+                    done.notify_all()
+                yield total_results, page_papers
+        finally:
+            stop.set()
+            with done: done.notify_all()
+            for thread in workers + [reader]: thread.join()
+
+    def iter_parse_lists(self, pages):
+        total = h.get_progressbar(len(pages), 'lists')
+        if self.show_progress: total.start()
+        if self.pipeline:
+            for i, (_, page_papers) in enumerate(self.iter_pipeline(pages)):
+                if self.show_progress: total.update(i + 1)
+                yield page_papers
+        elif self.list_concurrency > 1:
+            # every page url is known up front; keep a bounded window of pages in flight and yield them in page order
+            with ThreadPoolExecutor(max_workers=self.list_concurrency) as pool:
+                remaining = iter(pages)
+                window = collections.deque(
+                    pool.submit(self.fetch_parse_page, page, False)
+                    for page in itertools.islice(remaining, 2 * self.list_concurrency)
+                )
+                done = 0
+                while len(window) > 0:
+                    _, page_papers = window.popleft().result()
+                    for page in itertools.islice(remaining, 1):
+                        window.append(pool.submit(self.fetch_parse_page, page, False))
+                    done += 1
+                    if self.show_progress: total.update(done)
+                    yield page_papers
+        else:
+            for i, page in enumerate(pages):
+                if self.show_progress:
+                    total.update(i)
+                    h.console_up()
+                _, page_papers = self.fetch_parse_page(page, self.show_progress)
+                yield page_papers
+        if self.show_progress: total.finish()
+
+    def start_journal(self, resume):
+        start = { 'name': self.name, 'search_parameters': self.search_parameters, 'per_page': self.per_page }
+        if not resume:
+            self.journal.reset(start)
+            return
+        self.journal.load()
+        if self.journal.start is None:
+            self.journal.append({ 'type': 'start', **start })
+        elif any(self.journal.start.get(k) != v for k, v in start.items()):
+            raise Exception("%s belongs to a different search, run without resume" % self.journal_file_name())
+        else:
+            print(" - resuming: %d pages and %d papers already done" % (len(self.journal.pages), len(self.journal.papers)))
+
+    def plan_lists(self, probe=False):
+        # list pages and papers a run still has to fetch; without the first list page the totals are unknown,
+        # probe fetches it (one request) to find out
+        start_page = self.get_config('urls.list.start-page', 0)
+        if self.targeted:
+            cached = sum(1 for i in self.target_identifiers if self.paper_is_fresh(i))
+            total = len(self.target_identifiers)
+            return { 'total': 0, 'cached': 0, 'remaining': 0 }, { 'total': total, 'cached': cached, 'remaining': total - cached, 'exact': True }
+        if probe: self.fetch_list(start_page)
+        lists = { 'total': None, 'cached': 0, 'remaining': None }
+        papers = { 'total': None, 'cached': 0, 'remaining': None, 'exact': False }
+        if not self.list_file_exists(start_page): return lists, papers
+
+        first = self.preprocess_list(self.from_cache('list', self.list_cache_key(start_page), self.list_is_json))
+        total_results = self.total_number_of_results(first)
+        total_pages = max(1, math.ceil(total_results / self.per_page))
+        # identifiers of the cached pages, and how many papers the other pages hold
+        known, unknown = [], 0
+        for page in range(start_page, start_page + total_pages):
+            if not self.list_file_exists(page):
+                unknown += min(self.per_page, total_results - (page - start_page) * self.per_page)
+                continue
+            # a stale page still tells which papers it holds, but it is fetched again
+            if self.cache_state('list', self.list_cache_key(page), True) == 'fresh': lists['cached'] += 1
+            _list = first if page == start_page else self.preprocess_list(self.from_cache('list', self.list_cache_key(page), self.list_is_json))
+            known += self.identifiers(_list)
+        known = h.unique(known)
+        if len(self.restrict_identifiers_to) > 0:
+            known = [i for i in known if i in self.restrict_identifiers_to]
+            # only restricted identifiers that were not seen yet can be on the missing pages
+            unknown = min(unknown, len(self.restrict_identifiers_to.difference(known)))
+        cached = sum(1 for i in known if self.paper_is_fresh(i))
+        lists.update({ 'total': total_pages, 'remaining': total_pages - lists['cached'] })
+        papers.update({ 'total': len(known) + unknown, 'cached': cached, 'remaining': len(known) - cached + unknown, 'exact': unknown == 0 })
+        return lists, papers
+
+    def plan_pdfs(self, papers=None):
+        # pdfs download_pdfs still has to fetch; exact once there is a result, before that every paper counts
+        pdfs = { 'total': None, 'cached': 0, 'remaining': None, 'exact': False }
+        if h.check_file_exists(self.result_file_name()):
+            identifiers = [paper['identifier'] for paper in self.iter_result_papers() if 'pdf_num_pages' not in paper]
+            if len(self.restrict_identifiers_to) > 0:
+                identifiers = [i for i in identifiers if i in self.restrict_identifiers_to]
+            pdfs['exact'] = True
+        elif self.targeted:
+            identifiers = self.target_identifiers
+        elif papers is not None and papers['total'] is not None:
+            identifiers = [None] * papers['total']
+        else:
+            return pdfs
+        cached = sum(1 for i in identifiers if i is not None and self.cache_state('pdf', h.safe_filename(i), self.pdf_file_exists(i)) == 'fresh')
+        pdfs.update({ 'total': len(identifiers), 'cached': cached, 'remaining': len(identifiers) - cached })
+        return pdfs
+
+    def request_seconds(self, count, concurrency, latency):
+        # a host answers no faster than its rate limit, or than the latency spread over the requests in flight
+        if count is None: return None
+        return count * max(self.sleep_between_requests, latency / concurrency)
 
-    def run(self):
+    def plan(self, probe=False, latency=None):
+        # a dry run: what is left to fetch according to the cache manifest, and about how long it takes.
+        # The latency is the mean of the requests this fetcher made so far, or a guess of half a second.
+        lists, papers = self.plan_lists(probe)
+        pdfs = self.plan_pdfs(papers)
+        latency = latency or self.metrics.mean('http') or 0.5
+        pdf_latency = self.metrics.mean('pdf_download') or latency
+        seconds = {
+            'lists': self.request_seconds(lists['remaining'], self.list_concurrency, latency),
+            'papers': self.request_seconds(papers['remaining'], self.max_concurrency * self.list_concurrency, latency),
+            'pdfs': self.request_seconds(pdfs['remaining'], 1, pdf_latency)
+        }
+        return { 'config_name': self.config_name, 'name': self.name, 'lists': lists, 'papers': papers, 'pdfs': pdfs, 'latency': latency, 'seconds': seconds }
+
+    def run(self, resume=False):
+        if self.targeted: return self.run_targeted(resume)
         tic = time.perf_counter()
         print("", "---------------", "starting on %s - %s" % (self.config_name, self.name), sep="\n")
+        self.start_journal(resume)
+        self.evict_all()
+        dumper = None
+        if self.metrics_file is not None and self.metrics_every is not None:
+            dumper = metrics.PeriodicDump(self.metrics, self.metrics_file, self.metrics_every).start()
         
         print(" - fetching first page")
         start_page = self.get_config('urls.list.start-page', 0)
-        _list, papers = self.fetch_parse_list(start_page)
-        result = { 
-            'papers': [papers],
-            'total_results': self.total_number_of_results(_list)
-        }
+        total_results, papers = self.fetch_parse_page(start_page, self.show_progress)
+        writer = results.open_writer(self.result_file_name(), {
+            'name': self.name,
+            'config_name': self.config_name,
+            'search_parameters': self.search_parameters
+        })
+        writer.write_papers(papers)
+        total_filtered_results = len(papers)
         
-        pages_to_fetch = math.ceil(result['total_results'] / self.per_page) - 1
+        pages_to_fetch = math.ceil(total_results / self.per_page) - 1
+        self.status.update({ 'pages': 1, 'total_pages': pages_to_fetch + 1, 'papers': total_filtered_results })
 
-        sleep_for = self.get_config('sleep_between_requests')
-        print("This will take at least %.2f minutes if the cache is clean" % ((result['total_results'] * sleep_for) / 60))
+        # loading from the urls fetches everything again, the cache says nothing about how long that takes
+        if self.load_from == 'cache':
+            lists, papers = self.plan_lists()
+            latency = self.metrics.mean('http') or 0.5
+            seconds = [
+                self.request_seconds(lists['remaining'], self.list_concurrency, latency),
+                self.request_seconds(papers['remaining'], self.max_concurrency * self.list_concurrency, latency)
+            ]
+            # without a cached first list page, e.g. after it was evicted, the counts are unknown
+            unknown = lambda n, text: '?' if n is None else text % n
+            print("This will take about %s minutes: %s list pages and %s papers are not cached" % (
+                unknown(None if None in seconds else sum(seconds) / 60, "%.2f"), unknown(lists['remaining'], "%d"), unknown(papers['remaining'], "%d")
+            ))
 
         if ((pages_to_fetch) > 0):
             print(" - fetching the rest of the pages: %d" % (pages_to_fetch))
             
-            h.console_down()
-            total = h.get_progressbar(pages_to_fetch, 'lists')
-            total.start()
-            for i, page in enumerate(range(start_page + 1, pages_to_fetch + start_page + 1)):
-                total.update(i)
-                # if page >= 2: break
-                h.console_up()
-                _, papers = self.fetch_parse_list(page)
-                result['papers'].append(papers)
-            total.finish()
+            if self.show_progress: h.console_down()
+            pages = list(range(start_page + 1, pages_to_fetch + start_page + 1))
+            # pages are written as they come in, the jsonl result never holds more than a few pages in memory
+            for page_papers in self.iter_parse_lists(pages):
+                writer.write_papers(page_papers)
+                total_filtered_results += len(page_papers)
+                self.status.update({ 'pages': self.status['pages'] + 1, 'papers': total_filtered_results })
         
-        result['papers'] = h.flatten(result['papers'])
-        result['total_filtered_results'] = len(result['papers'])
-        result['total_pages'] = pages_to_fetch + 1
-        h.write_json_file(self.result_file_name(), result)
+        self.flush_caches()
+        if self.index is not None: self.index.flush()
+        result = writer.close({
+            'total_results': total_results,
+            'total_filtered_results': total_filtered_results,
+            'total_pages': pages_to_fetch + 1
+        })
+        toc = time.perf_counter()
+        if self.show_progress: h.console_down()
+        stats = self.connection_stats()
+        print(f"Connections: {stats['new']} opened, {stats['reused']} reused for {stats['requests']} requests")
+        print(f"Time per stage, summed over threads: {self.metrics.summary()}")
+        if dumper is not None: dumper.stop()
+        if self.metrics_file is not None: self.metrics.dump(self.metrics_file)
+        print(f"Finished {self.config_name} - {self.name} in {toc - tic:0.4f} seconds\n")
+        return result
+
+    def run_targeted(self, resume=False):
+        # every restricted identifier is fetched through paper_url, in the given order and in chunks of per_page
+        if len(self.target_identifiers) <= 0: raise Exception("a targeted run needs restrict_identifiers_to")
+        tic = time.perf_counter()
+        print("", "---------------", "starting on %s - %s for %d identifiers" % (self.config_name, self.name, len(self.target_identifiers)), sep="\n")
+        self.start_journal(resume)
+        self.evict_all()
+        dumper = None
+        if self.metrics_file is not None and self.metrics_every is not None:
+            dumper = metrics.PeriodicDump(self.metrics, self.metrics_file, self.metrics_every).start()
+
+        if self.load_from == 'cache':
+            _, papers = self.plan_lists()
+            minutes = self.request_seconds(papers['remaining'], self.max_concurrency, self.metrics.mean('http') or 0.5) / 60
+            print("This will take about %.2f minutes: %d papers are not cached" % (minutes, papers['remaining']))
+
+        writer = results.open_writer(self.result_file_name(), {
+            'name': self.name,
+            'config_name': self.config_name,
+            'search_parameters': self.search_parameters
+        })
+        chunks = self.target_chunks()
+        total_filtered_results = 0
+        self.status.update({ 'pages': 0, 'total_pages': len(chunks), 'papers': 0 })
+        for chunk in chunks:
+            page_papers = self.fetch_parse_papers(chunk, self.show_progress)
+            writer.write_papers(page_papers)
+            self.journal.forget(chunk)
+            total_filtered_results += len(page_papers)
+            self.status.update({ 'pages': self.status['pages'] + 1, 'papers': total_filtered_results })
+
+        self.flush_caches()
+        if self.index is not None: self.index.flush()
+        result = writer.close({
+            'total_results': len(self.target_identifiers),
+            'total_filtered_results': total_filtered_results,
+            'total_pages': len(chunks)
+        })
         toc = time.perf_counter()
-        h.console_down()
+        stats = self.connection_stats()
+        print(f"Connections: {stats['new']} opened, {stats['reused']} reused for {stats['requests']} requests")
+        print(f"Time per stage, summed over threads: {self.metrics.summary()}")
+        if dumper is not None: dumper.stop()
+        if self.metrics_file is not None: self.metrics.dump(self.metrics_file)
         print(f"Finished {self.config_name} - {self.name} in {toc - tic:0.4f} seconds\n")
         return result
 
-    def export_results_to_csv(self, fields=[], file_path='./total.csv', override=False, defaults={}, sort_by=None):
-        result = h.read_json_file(self.result_file_name())
-        if not 'papers' in result: raise Exception("Illformed %s" % self.result_file_name())
-        if len(result['papers']) <= 0: return
-        if len(fields) <= 0: fields = list(result['papers'][0].keys())
+    def target_chunks(self):
+        # the targeted mode's stand-in for list pages, per_page identifiers each
+        return [self.target_identifiers[i:i + self.per_page] for i in range(0, len(self.target_identifiers), self.per_page)]
 
-        if h.check_file_exists(file_path) and not override:
-            df = pd.read_csv(file_path)
+    def rebuild(self, processes=None, chunk_size=50):
+        # writes the result again from the cache only, parsing papers in a process pool
+        tic = time.perf_counter()
+        print("", "---------------", "rebuilding %s - %s from the cache" % (self.config_name, self.name), sep="\n")
+        start_page = self.get_config('urls.list.start-page', 0)
+        page_identifiers, missing_lists, pages = [], [], []
+        if self.targeted:
+            # the identifiers stand in for the list pages, in the same chunks as run_targeted
+            page_identifiers = self.target_chunks()
+            total_results, total_pages = len(self.target_identifiers), len(page_identifiers)
+        elif not self.list_file_exists(start_page):
+            raise Exception("%s has no cached first page, run it first" % self.name)
         else:
-            df = pd.DataFrame(columns=fields)
-        
-        print(f"Exporting {self.name} - {self.config_name} paper to csv.")
-        total = h.get_progressbar(len(result['papers']), 'pdf')
+            first = self.preprocess_list(self.from_cache('list', self.list_cache_key(start_page), self.list_is_json))
+            total_results = self.total_number_of_results(first)
+            total_pages = math.ceil(total_results / self.per_page)
+            pages = range(start_page, total_pages + start_page)
+        for page in pages:
+            if not self.list_file_exists(page):
+                missing_lists.append(page)
+                continue
+            _list = first if page == start_page else self.preprocess_list(self.from_cache('list', self.list_cache_key(page), self.list_is_json))
+            identifiers = self.identifiers(_list)
+            if len(self.restrict_identifiers_to) > 0:
+                identifiers = [i for i in identifiers if i in self.restrict_identifiers_to]
+            page_identifiers.append(identifiers)
+
+        unique = list(dict.fromkeys(i for identifiers in page_identifiers for i in identifiers))
+        chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+        parsed, missing_papers = {}, []
+        total = h.get_progressbar(len(unique), 'cached papers')
         total.start()
-        for i, paper in enumerate(result['papers']):
-            if len(self.restrict_identifiers_to) > 0 and paper['identifier'] not in self.restrict_identifiers_to: continue
-            paper_dict = {
-                k: ( paper[k] if not isinstance(paper[k], list) else ", ".join(paper[k]) ) 
-                    if k in paper else
-                    ( defaults[k] if k in paper else None )
-                for k 
-                in fields
-            }
-            df = df.append(paper_dict, ignore_index=True)
+        # workers get their own fetcher, there is nothing to share but the config
+        worker_kwargs = { k: v for k, v in self.kwargs.items() if k not in ('restrict_identifiers_to', 'index') }
+        with ProcessPoolExecutor(max_workers=processes, initializer=init_rebuild_worker, initargs=(self.search_parameters, worker_kwargs)) as pool:
+            for chunk in pool.map(rebuild_chunk, chunks):
+                for identifier, paper in chunk:
+                    if paper is None:
+                        missing_papers.append(identifier)
+                        continue
+                    if self.index is not None: self.index.add(paper)
+                    parsed[identifier] = self.postprocess_paper(paper)
+                total.update(len(parsed) + len(missing_papers))
+        total.finish()
+
+        writer = results.open_writer(self.result_file_name(), {
+            'name': self.name,
+            'config_name': self.config_name,
+            'search_parameters': self.search_parameters
+        })
+        total_filtered_results = 0
+        for identifiers in page_identifiers:
+            papers = [parsed[i] for i in identifiers if parsed.get(i) is not None]
+            writer.write_papers(papers)
+            total_filtered_results += len(papers)
+        if self.index is not None: self.index.flush()
+        result = writer.close({
+            'total_results': total_results,
+            'total_filtered_results': total_filtered_results,
+            'total_pages': total_pages
+        })
+
+        if len(missing_lists) > 0:
+            print("%d list pages are not cached: %s" % (len(missing_lists), ", ".join(map(str, missing_lists[:10]))))
+        if len(missing_papers) > 0:
+            print("%d papers are not cached: %s" % (len(missing_papers), ", ".join(missing_papers[:10])))
+        toc = time.perf_counter()
+        print(f"Rebuilt {self.config_name} - {self.name} from {len(parsed)} papers in {toc - tic:0.4f} seconds\n")
+        return result
+
+    def cached_identifiers(self):
+        # identifiers of every cached list page of this config, whatever search they came from
+        seen = set()
+        for key in self.cache.keys('list'):
+            _list = self.preprocess_list(self.from_cache('list', key, self.list_is_json))
+            for identifier in self.identifiers(_list):
+                if identifier in seen: continue
+                seen.add(identifier)
+                yield identifier
+
+    def update_index(self, show_progress=True):
+        # adds the cached papers that are not indexed yet, without touching the network
+        if self.index is None: self.index = PaperIndex(self.index_file_name())
+        indexed = self.index.identifiers()
+        identifiers = [
+            i for i in self.cached_identifiers()
+            if i not in indexed and self.paper_file_exists(i)
+        ]
+        if show_progress:
+            total = h.get_progressbar(len(identifiers), 'index')
+            total.start()
+        for i, identifier in enumerate(identifiers):
+            if show_progress: total.update(i)
+            _paper = self.from_cache('paper', self.paper_cache_key(identifier), self.paper_is_json)
+            self.parse_paper(identifier, _paper)
+        if show_progress: total.finish()
+        if self.record_cache is not None: self.record_cache.flush()
+        self.index.flush()
+        return len(identifiers)
+
+    def search_index(self, query, case_sensitive=True, match_mode='substring'):
+        if self.index is None: self.index = PaperIndex(self.index_file_name())
+        return self.index.search(query, case_sensitive, match_mode)
+
+    def iter_result_papers(self):
+        return results.iter_papers(self.result_file_name())
+
+    def result_summary(self):
+        return results.read_summary(self.result_file_name())
+
+    def export_results_to_csv(self, fields=[], file_path='./total.csv', override=False, defaults={}, sort_by=None, dedupe=False):
+        return self.export_results(fields, file_path, override, defaults, sort_by, dedupe)
+
+    def export_results(self, fields=[], file_path='./total.csv', override=False, defaults={}, sort_by=None, dedupe=False, file_format=None):
+        # file_format is csv or parquet, by default taken from the extension of file_path
+        if file_format is None: file_format = 'parquet' if file_path.endswith('.parquet') else 'csv'
+        summary = self.result_summary()
+        papers = self.iter_result_papers()
+        first = next(papers, None)
+        if first is None: return
+        if len(fields) <= 0: fields = list(first.keys())
+
+        append = h.check_file_exists(file_path) and not override
+        seen = self.exported_identifiers(file_path, file_format) if append and dedupe else set()
+
+        print(f"Exporting {self.name} - {self.config_name} paper to {file_format}.")
+        columns = { k: [] for k in fields }
+        total = h.get_progressbar(summary['total_filtered_results'], 'pdf')
+        total.start()
+        for i, paper in enumerate(itertools.chain([first], papers)):
             total.update(i)
+            if len(self.restrict_identifiers_to) > 0 and paper['identifier'] not in self.restrict_identifiers_to: continue
+            if dedupe:
+                if paper['identifier'] in seen: continue
+                seen.add(paper['identifier'])
+            for k in fields:
+                value = paper[k] if k in paper else defaults.get(k)
+                columns[k].append(", ".join(value) if isinstance(value, list) else value)
         total.finish()
+        df = pd.DataFrame(columns, columns=fields)
 
         if sort_by is not None:
             if not isinstance(sort_by, list):
                 sort_by = [sort_by]
             
             if all(map(lambda x: x in fields, sort_by)):
-                df.sort_values(by=sort_by)
+                # when appending only the new rows are sorted, the existing file is left as it is
+                df = df.sort_values(by=sort_by)
             else:
                 warnings.warn(f"could not find sorting field: {str(sort_by)} is not completely in {str(fields)}")
 
-        df.to_csv(file_path, index=False)
+        if file_format == 'csv': self.write_csv(df, file_path, append)
+        elif file_format == 'parquet': self.write_parquet(df, file_path, append)
+        else: raise Exception("export format %s could not be found" % file_format)
+
+    def exported_identifiers(self, file_path, file_format):
+        try:
+            if file_format == 'parquet': existing = pd.read_parquet(file_path, columns=['identifier'])
+            else: existing = pd.read_csv(file_path, usecols=['identifier'], dtype=str)
+        except (KeyError, ValueError):
+            warnings.warn(f"could not dedupe against {file_path}, it has no identifier column")
+            return set()
+        return set(existing['identifier'].dropna())
+
+    def write_csv(self, df, file_path, append):
+        if not append:
+            df.to_csv(file_path, index=False)
+            return
+        # only the header of the existing file is read, the rows are appended in place
+        header = list(pd.read_csv(file_path, nrows=0).columns)
+        missing = [k for k in df.columns if k not in header]
+        if len(missing) > 0: warnings.warn(f"{file_path} has no columns {str(missing)}, they are not exported")
+        df.reindex(columns=header).to_csv(file_path, mode='a', header=False, index=False)
 
-    def download_pdfs(self, save_folder='./pdfs', save_name="identifier", override=False):
-        result = h.read_json_file(self.result_file_name())
-        if not 'papers' in result: raise Exception("Illformed %s" % self.result_file_name())
-        if len(result['papers']) <= 0: return
+    def write_parquet(self, df, file_path, append):
+        # a parquet export is a dataset folder, appending adds a part instead of rewriting the file
+        if os.path.isfile(file_path):
+            # a single file from an earlier export becomes the first part of the folder
+            if append:
+                tmp_path = file_path + ".part"
+                os.replace(file_path, tmp_path)
+                os.makedirs(file_path)
+                os.replace(tmp_path, f"{file_path}/part-00000.parquet")
+            else: os.remove(file_path)
+        if not append and os.path.isdir(file_path): shutil.rmtree(file_path)
+        if append and len(df) <= 0: return
+        h.ensure_path_exists(file_path, True)
+        part = len(glob.glob(f"{file_path}/part-*.parquet"))
+        df.to_parquet(f"{file_path}/part-{part:05d}.parquet", index=False)
+
+    def download_pdfs(self, save_folder='./pdfs', save_name="identifier", override=False, processes=None, resume=False):
+        summary = self.result_summary()
+        if summary['total_filtered_results'] <= 0: return
+
+        num_pages_key = 'pdf_num_pages'
+        num_pages = {}
+        if resume:
+            # page counts of an interrupted download that never made it into the result file
+            self.journal.load()
+            num_pages = { i: n for i, n in self.journal.pdfs.items() if n is not None }
 
         save_folder = f"{save_folder}"
         h.ensure_path_exists(save_folder, True)
+        self.evict_all()
         
-        sleep_for = self.get_config('sleep_between_requests')
-
         print(f"Downloading {self.name} - {self.config_name} paper pdfs.")
-        sleep_for = self.get_config('sleep_between_requests')
-        print("This will take at least %.2f hours if all papers need to be downloaded" % ((result['total_results'] * sleep_for) / 60 / 60))
+        if self.load_from == 'cache':
+            remaining = self.plan_pdfs()
+            hours = self.request_seconds(remaining['remaining'], 1, self.metrics.mean('pdf_download') or self.metrics.mean('http') or 0.5) / 60 / 60
+            print("This will take about %.2f hours: %d of %d pdfs are not cached" % (hours, remaining['remaining'], remaining['total']))
 
-        total = h.get_progressbar(len(result['papers']), 'pdf')
-        total.start()
-        for i, paper in enumerate(result['papers']):
-            total.update(i)
-            if len(self.restrict_identifiers_to) > 0 and paper['identifier'] not in self.restrict_identifiers_to: continue
-            
-            num_pages_key = 'pdf_num_pages'
-            if num_pages_key in paper and not override: continue
-
-            file_name = h.safe_filename(f"{paper['identifier']}.pdf")
-            file_name = f"{save_folder}/{file_name}"
-            
-            content = self.fetch_pdf(paper['identifier'])
-            with open(file_name, "wb") as f: f.write(content)
+        saved_file = lambda identifier: "%s/%s" % (save_folder, h.safe_filename(f"{identifier}.pdf"))
 
-            try:
-                pdf_file = io.BytesIO(content)
-                pdf_reader = PyPDF2.PdfFileReader(pdf_file)
-                paper[num_pages_key] = pdf_reader.getNumPages()
-                result['papers'][i] = paper
-            except PyPDF2.utils.PdfReadError:
-                os.remove(self.pdf_file_name(paper['identifier']))
+        def counted(identifier, future):
+            count, seconds = future.result()
+            self.metrics.observe('pdf_pages', seconds, error=count is None)
+            self.journal.pdf_done(identifier, count)
+            if count is not None:
+                num_pages[identifier] = count
+            else:
+                # the exported link first, so the stored object goes with the last link to it
+                if os.path.lexists(saved_file(identifier)): os.remove(saved_file(identifier))
+                self.remove_cached('pdf', h.safe_filename(identifier))
                 h.console_down()
-                print(f"Reading PDF failed: id {paper['identifier']}")
-            
-        total.finish()
-        h.write_json_file(self.result_file_name(), result)
+                print(f"Reading PDF failed: id {identifier}")
+
+        # page counting is CPU bound, so it runs in a process pool while the downloads continue;
+        # every count goes to the journal as soon as it is done, an interrupted download keeps them
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            counting = {}
+            total = h.get_progressbar(summary['total_filtered_results'], 'pdf')
+            total.start()
+            for i, paper in enumerate(self.iter_result_papers()):
+                total.update(i)
+                if len(self.restrict_identifiers_to) > 0 and paper['identifier'] not in self.restrict_identifiers_to: continue
+                
+                if (num_pages_key in paper or paper['identifier'] in num_pages) and not override: continue
+
+                file_name = saved_file(paper['identifier'])
+
+                try:
+                    pdf_path = self.fetch_pdf(paper['identifier'])
+                except RequestFailed as e:
+                    h.console_down()
+                    print(f"Downloading PDF failed: id {paper['identifier']}, {e}")
+                    continue
+                h.link_file(pdf_path, file_name)
+                counting[paper['identifier']] = pool.submit(pdfs.count_pages_timed, pdf_path)
+                for identifier in [i for i, future in counting.items() if future.done()]:
+                    counted(identifier, counting.pop(identifier))
+            total.finish()
+
+            for identifier, future in counting.items(): counted(identifier, future)
+
+        def add_num_pages(paper):
+            if paper['identifier'] in num_pages: paper[num_pages_key] = num_pages[paper['identifier']]
+            return paper
+        results.rewrite(self.result_file_name(), add_num_pages)
+        self.cache_meta.flush()
+        if self.metrics_file is not None: self.metrics.dump(self.metrics_file)
+
+def plan_text(plan):
+    def counts(what, c):
+        if c['remaining'] is None: return "? %s" % what
+        return "%d of %d %s%s" % (c['remaining'], c['total'], what, '' if c.get('exact', True) else ' (estimated)')
+    known = [s for s in plan['seconds'].values() if s is not None]
+    return "%s - %s: %s, %s and %s to fetch, about %.2f minutes%s" % (
+        plan['config_name'], plan['name'], counts('list pages', plan['lists']), counts('papers', plan['papers']), counts('pdfs', plan['pdfs']),
+        sum(known) / 60, '' if len(known) == len(plan['seconds']) else ' for what is known'
+    )
+
+rebuild_fetcher = None
+
+def init_rebuild_worker(search_parameters, kwargs):
+    global rebuild_fetcher
+    rebuild_fetcher = Fetcher(search_parameters, load_from='cache', **kwargs)
+
+def rebuild_chunk(identifiers):
+    # a paper that is not cached comes back as None, the rebuild never fetches
+    f = rebuild_fetcher
+    papers = [
+        (i, f.extract_paper(i, f.from_cache('paper', f.paper_cache_key(i), f.paper_is_json)) if f.paper_file_exists(i) else None)
+        for i in identifiers
+    ]
+    if f.record_cache is not None: f.record_cache.flush()
+    return papers
 
 if __name__ == "__main__":
 
@@ -607,7 +1481,7 @@ if __name__ == "__main__":
     tic = time.perf_counter()
     
     identifier_file = './identifiers.csvs'
-    restrict = pd.read_csv(identifier_file, header=None)[0].to_list() if h.check_file_exists(identifier_file) else []
+    restrict = pd.read_csv(identifier_file, header=None, dtype=str)[0].to_list() if h.check_file_exists(identifier_file) else []
 
     fp = "./restricted.csv"
     fp2 = './pdf_pages.csv'
@@ -615,6 +1489,7 @@ if __name__ == "__main__":
     # os.remove(fp2)
 
     for finder in finders:
+        # with an identifier file every search keeps only those papers, targeted=True would fetch them without the search
         find = Fetcher(restrict_identifiers_to=restrict, **finder)
         find.run()
         # find.export_results_to_csv(['pdf_file_name', 'title', 'authors', 'doi_url'], file_path=fp)
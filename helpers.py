@@ -6,6 +6,12 @@ import progressbar
 from urllib import parse
 import io
 import json
+import threading
+import time
+import hashlib
+import shutil
+import random
+import email.utils
 
 def search_for(obj, look_in, look_for):
     string = obj[look_in]
@@ -15,34 +21,65 @@ def insert_identifier(string, identifier, replace = 'identifier'):
     return string.replace("{%s}" % str(replace), str(identifier))
 
 def get_dict_field(d, field, default=None):
-    def throw(): 
+    return compile_path(field).get(d, default)
+
+def path_index(key):
+    try: return int(key)
+    except ValueError: return None
+
+class JsonPath:
+    # A dotted path split once into its segments. get() behaves like the
+    # recursive walk it replaces: '*' maps over a list, a number indexes
+    # one, and the default only covers a miss on the first segment or
+    # anywhere below a first segment that indexes a list.
+    def __init__(self, path):
+        self.path = path
+        self.segments = path.split('.')
+        self.indexes = [path_index(key) for key in self.segments]
+        self.rests = ['.'.join(self.segments[i:]) for i in range(len(self.segments))]
+        self.last = len(self.segments) - 1
+
+    def throw(self, default, i):
         if default is None:
-            raise ValueError("%s could not be found in dict", field)
+            raise ValueError("%s could not be found in dict", self.rests[i])
         else:
             return default
-    
-    if not isinstance(d, dict) and not isinstance(d, list):
-        raise Exception(f"Should not try to access other than dicts and lists: {type(d)}")
-    
-    i = field.find(".")
-    if i > -1:
-        key = field[0:i]
-        if key == '*' and isinstance(d, list):
-            res = []
-            for value in d:
-                res.append(get_dict_field(value, field[i+1:]))
-            return res
-        elif isinstance(d, list):
-            try:
-                index = int(key)
-                return get_dict_field(d[index], field[i+1:])
-            except:
-                return throw()
-        if key not in d: return throw()
-        return get_dict_field(d[key], field[i+1:])
-    
-    if field not in d: return throw()
-    return d[field]
+
+    def get(self, d, default=None):
+        # plain dict steps need no recursion
+        i = 0
+        while i < self.last and type(d) is dict and self.segments[i] in d:
+            d = d[self.segments[i]]
+            i += 1
+        return self.get_from(d, default if i == 0 else None, i)
+
+    def get_from(self, d, default, i):
+        if not isinstance(d, dict) and not isinstance(d, list):
+            raise Exception(f"Should not try to access other than dicts and lists: {type(d)}")
+
+        key = self.segments[i]
+        if i < self.last:
+            if key == '*' and isinstance(d, list):
+                return [self.get_from(value, None, i + 1) for value in d]
+            elif isinstance(d, list):
+                try:
+                    return self.get_from(d[self.indexes[i]], None, i + 1)
+                except:
+                    return self.throw(default, i)
+            if key not in d: return self.throw(default, i)
+            return self.get_from(d[key], None, i + 1)
+
+        if key not in d: return self.throw(default, i)
+        return d[key]
+
+_json_paths = {}
+
+def compile_path(path):
+    # compiled paths are shared, a config only ever uses a handful of them
+    compiled = _json_paths.get(path)
+    if compiled is None:
+        compiled = _json_paths[path] = JsonPath(path)
+    return compiled
 
 def check_file_exists(file_path):
     return os.path.exists(file_path)
@@ -58,22 +95,111 @@ def ensure_path_exists(file_path, is_directory=False):
         directory = file_path
     else:
         directory = os.path.dirname(file_path)
+    # a bare file name lives in the working directory
+    if directory == '': return
     try:
         os.stat(directory)
     except:
-        os.makedirs(directory)
+        os.makedirs(directory, exist_ok=True)
 
-def unique(l): 
-    unique_list = [] 
-    for x in l: 
-        if x not in unique_list: 
-            unique_list.append(x) 
-    return unique_list
+def unique(l):
+    l = list(l)
+    try: return list(dict.fromkeys(l))
+    except TypeError:
+        # unhashable items (lists, dicts) can only be compared one by one
+        unique_list = []
+        for x in l:
+            if x not in unique_list:
+                unique_list.append(x)
+        return unique_list
 
 def flatten(l):
     if not any(isinstance(el, list) for el in l): return l
     return [item for sublist in l for item in sublist]
 
+class TokenBucket:
+    def __init__(self, interval, capacity=1):
+        # one token every `interval` seconds, the same budget as sleeping `interval` after each request
+        self.interval = interval
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.interval <= 0: return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) * self.interval
+            time.sleep(wait_for)
+
+class AdaptiveRateLimiter(TokenBucket):
+    # AIMD on the request rate: every healthy response adds `increase` times the starting rate
+    # until `min_interval`, every throttled or failed one multiplies the interval by `backoff`.
+    # By default it never goes faster than `interval`, only a smaller min_interval allows that
+    def __init__(self, interval, min_interval=None, max_interval=60, increase=0.1, backoff=2, floor=0.25):
+        super().__init__(interval)
+        self.min_interval = interval if min_interval is None else min_interval
+        self.max_interval = max_interval
+        # the interval a limiter without any sleep falls back to on its first failure
+        self.floor = floor
+        self.step = increase / (interval if interval > 0 else floor)
+        self.backoff = backoff
+        self.paused_until = 0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                wait_for = self.paused_until - time.monotonic()
+            if wait_for <= 0: break
+            time.sleep(wait_for)
+        super().acquire()
+
+    def success(self):
+        with self.lock:
+            if self.interval <= self.min_interval: return
+            self.interval = max(self.min_interval, 1 / (1 / self.interval + self.step))
+
+    def failure(self, retry_after=None):
+        with self.lock:
+            self.interval = min(self.max_interval, max(self.floor, self.interval * self.backoff))
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def rate_limiter(host, interval, adaptive=False, **options):
+    # one limiter per host and settings, shared by every fetcher and thread that asks for the same ones;
+    # a fetcher with its own interval or rate_control gets its own limiter and never an earlier one's state
+    key = (host, interval, adaptive, tuple(sorted(options.items())))
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = AdaptiveRateLimiter(interval, **options) if adaptive else TokenBucket(interval)
+        return _rate_limiters[key]
+
+def retry_after_seconds(value):
+    # Retry-After is either a number of seconds or an http date
+    if value is None: return None
+    try: return max(0.0, float(value))
+    except ValueError: pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date is None: return None
+    return max(0.0, date.timestamp() - time.time())
+
+def backoff_delay(attempt, base=0.5, cap=30):
+    # full jitter, so retrying threads do not come back all at once
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
 def console_up():
     # My terminal breaks if we don't flush after the escape-code
     sys.stdout.write('\x1b[1A')
@@ -122,7 +248,6 @@ def url_base_with_path(url):
     return "%s%s" % (url_base(url), url_path(url))
 
 def read_file(file_path):
-    ensure_path_exists(file_path)
     with io.open(file_path, "r", encoding="utf-8") as f:
         return f.read()
 
@@ -133,6 +258,25 @@ def write_file(file_path, file_content):
             file_content = json.dumps(file_content)
         f.write(file_content)
 
+def file_digest(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_file(source, target):
+    # hardlink, then symlink, and only copy when the filesystem supports neither
+    ensure_path_exists(target)
+    if os.path.lexists(target): os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        try:
+            os.symlink(os.path.abspath(source), target)
+        except OSError:
+            shutil.copyfile(source, target)
+
 def read_json_file(file_path):
     with open(file_path, "r") as f:
         return json.load(f)
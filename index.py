@@ -0,0 +1,159 @@
+import re
+import sys
+import json
+import sqlite3
+import threading
+import helpers as h
+from query import compile_query, filter_papers
+
+INDEXED_FIELDS = ['title', 'abstract', 'keywords', 'authors', 'published_in']
+WORD = re.compile(r'\w+')
+# sorts after every other character, 'abc' <= token < 'abc' + LAST is a prefix range
+LAST = chr(0x10ffff)
+
+def field_tokens(paper, field):
+    value = paper.get(field, '')
+    if isinstance(value, list): value = "\n".join(map(str, value))
+    elif not isinstance(value, str): value = str(value)
+    return set(WORD.findall(value.lower()))
+
+def term_pieces(term, match_mode='substring'):
+    # every word of a term has to be found in some token: exactly, as a prefix or anywhere inside it
+    if match_mode == 'substring':
+        return [(piece, 'contains') for piece in WORD.findall(term.replace('*', '').lower())]
+    term = term.lower()
+    pieces = []
+    for m in WORD.finditer(term):
+        left_open = m.start() > 0 and term[m.start() - 1] == '*'
+        right_open = m.end() < len(term) and term[m.end()] == '*'
+        if left_open: pieces.append((m.group(), 'contains'))
+        elif right_open: pieces.append((m.group(), 'prefix'))
+        else: pieces.append((m.group(), 'exact'))
+    return pieces
+
+class PaperIndex:
+    # Inverted index over parsed papers. The postings only narrow a query down
+    # to candidates, which are then checked with the compiled query, so a
+    # search gives the same answer as the postprocessing filter would.
+    def __init__(self, file_path, batch_size=200):
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.pending = {}
+        self.lock = threading.RLock()
+        h.ensure_path_exists(file_path)
+        self.db = sqlite3.connect(file_path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS papers (identifier TEXT PRIMARY KEY, paper TEXT NOT NULL)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "field TEXT NOT NULL, token TEXT NOT NULL, identifier TEXT NOT NULL, "
+            "PRIMARY KEY (field, token, identifier)) WITHOUT ROWID"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            "field TEXT NOT NULL, token TEXT NOT NULL, PRIMARY KEY (field, token)) WITHOUT ROWID"
+        )
+        self.db.commit()
+
+    def add(self, paper):
+        with self.lock:
+            self.pending[paper['identifier']] = paper
+            if len(self.pending) >= self.batch_size: self.flush()
+
+    def identifiers(self):
+        self.flush()
+        with self.lock:
+            return set(row[0] for row in self.db.execute("SELECT identifier FROM papers"))
+
+    def postings(self, paper):
+        return [(field, token, paper['identifier']) for field in INDEXED_FIELDS for token in field_tokens(paper, field)]
+
+    def flush(self):
+        with self.lock:
+            if len(self.pending) <= 0: return
+            papers, stale, fresh = [], [], []
+            for identifier, paper in self.pending.items():
+                content = json.dumps(paper)
+                row = self.db.execute("SELECT paper FROM papers WHERE identifier = ?", (identifier,)).fetchone()
+                if row is not None and row[0] == content: continue
+                # the old postings are found again from the stored paper
+                if row is not None: stale += self.postings(json.loads(row[0]))
+                papers.append((identifier, content))
+                fresh += self.postings(paper)
+            self.db.executemany("DELETE FROM postings WHERE field = ? AND token = ? AND identifier = ?", stale)
+            self.db.executemany("INSERT OR REPLACE INTO papers (identifier, paper) VALUES (?, ?)", papers)
+            # sorted rows go into the b-tree in order, which is a lot faster for large batches
+            fresh.sort()
+            self.db.executemany("INSERT OR IGNORE INTO postings (field, token, identifier) VALUES (?, ?, ?)", fresh)
+            self.db.executemany("INSERT OR IGNORE INTO tokens (field, token) VALUES (?, ?)", sorted(set(r[:2] for r in fresh)))
+            self.db.commit()
+            self.pending = {}
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def piece_candidates(self, field, piece, kind):
+        if kind == 'exact':
+            sql, args = "SELECT identifier FROM postings WHERE field = ? AND token = ?", (field, piece)
+        elif kind == 'prefix':
+            sql, args = "SELECT identifier FROM postings WHERE field = ? AND token >= ? AND token < ?", (field, piece, piece + LAST)
+        else:
+            sql = (
+                "SELECT identifier FROM postings WHERE field = ? AND token IN "
+                "(SELECT token FROM tokens WHERE field = ? AND instr(token, ?) > 0)"
+            )
+            args = (field, field, piece)
+        return set(row[0] for row in self.db.execute(sql, args))
+
+    def match_candidates(self, field, term, match_mode):
+        # None stands for every paper, the index can not narrow this term down
+        if field not in INDEXED_FIELDS: return None
+        found = None
+        for piece, kind in term_pieces(term, match_mode):
+            ids = self.piece_candidates(field, piece, kind)
+            found = ids if found is None else found & ids
+        return found
+
+    def candidates(self, query, match_mode='substring'):
+        match = query.get('match', {})
+        if len(match) > 1: raise Exception(f"match should not be longer than 1, found {len(match)} items")
+        for key in match:
+            return self.match_candidates(key, match[key], match_mode)
+
+        found = None
+        should = [self.candidates(s, match_mode) for s in query.get('should', [])]
+        if len(should) > 0 and all(s is not None for s in should):
+            found = set().union(*should)
+        for m in query.get('must', []):
+            ids = self.candidates(m, match_mode)
+            if ids is None: continue
+            found = ids if found is None else found & ids
+        return found
+
+    def search(self, query, case_sensitive=True, match_mode='substring'):
+        self.flush()
+        predicate = compile_query(query, case_sensitive, match_mode)
+        with self.lock:
+            ids = self.candidates(query, match_mode)
+            if ids is None:
+                rows = self.db.execute("SELECT paper FROM papers ORDER BY rowid").fetchall()
+            else:
+                self.db.execute("CREATE TEMP TABLE IF NOT EXISTS candidates (identifier TEXT PRIMARY KEY)")
+                self.db.execute("DELETE FROM candidates")
+                self.db.executemany("INSERT INTO candidates (identifier) VALUES (?)", ((i,) for i in ids))
+                rows = self.db.execute(
+                    "SELECT paper FROM papers WHERE identifier IN (SELECT identifier FROM candidates) ORDER BY rowid"
+                ).fetchall()
+        return filter_papers((json.loads(row[0]) for row in rows), predicate)
+
+if __name__ == "__main__":
+    # python index.py search ./cache/acm/index.sqlite '{"match": {"title": "touch*"}}' [substring|word] [ignore-case]
+    if len(sys.argv) < 4 or sys.argv[1] != 'search':
+        sys.exit("usage: python index.py search <index_file> <query_json> [substring|word] [ignore-case]")
+    index = PaperIndex(sys.argv[2])
+    match_mode = sys.argv[4] if len(sys.argv) > 4 else 'substring'
+    case_sensitive = not (len(sys.argv) > 5 and sys.argv[5] == 'ignore-case')
+    for paper in index.search(json.loads(sys.argv[3]), case_sensitive, match_mode):
+        print("%s\t%s" % (paper['identifier'], paper['title']))
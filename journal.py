@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import threading
+import helpers as h
+
+# what get_paper returns for a paper that is not done, a done paper is None when it was filtered out
+MISSING = object()
+
+class Journal:
+    # Append-only JSON lines log of finished work. Every completed paper,
+    # list page and pdf page count is appended as soon as it is done, so a
+    # resumed run only has to do what is not in here yet.
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.file = None
+        self.start = None
+        self.pages = {}
+        self.papers = {}
+        self.pdfs = {}
+        # pages in flight per identifier, a paper stays in memory until the last of them is done with it
+        self.holds = {}
+
+    def load(self):
+        if not h.check_file_exists(self.file_path): return self
+        with io.open(self.file_path, "rb+") as f:
+            offset = 0
+            for line in f:
+                try: record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    # the last line of an interrupted run may be cut off, drop it before appending again
+                    f.truncate(offset)
+                    break
+                self.apply(record)
+                offset += len(line)
+        return self
+
+    def apply(self, record):
+        if record['type'] == 'start': self.start = record
+        elif record['type'] == 'page': self.pages[record['page']] = record
+        elif record['type'] == 'paper': self.papers[record['identifier']] = record['paper']
+        elif record['type'] == 'pdf': self.pdfs[record['identifier']] = record['pdf_num_pages']
+
+    def append(self, record):
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.apply(record)
+            if self.file is None:
+                h.ensure_path_exists(self.file_path)
+                self.file = io.open(self.file_path, "a", encoding="utf-8")
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None: self.file.close()
+            self.file = None
+
+    def reset(self, start):
+        self.close()
+        with self.lock:
+            if h.check_file_exists(self.file_path): os.remove(self.file_path)
+            self.start, self.pages, self.papers, self.pdfs, self.holds = None, {}, {}, {}, {}
+        self.append({ 'type': 'start', **start })
+
+    def get_paper(self, identifier):
+        with self.lock:
+            return self.papers.get(identifier, MISSING)
+
+    def paper_done(self, identifier, paper):
+        self.append({ 'type': 'paper', 'identifier': identifier, 'paper': paper })
+
+    def page_done(self, page, total_results, identifiers):
+        self.append({ 'type': 'page', 'page': page, 'total_results': total_results, 'identifiers': identifiers })
+
+    def hold(self, identifiers):
+        # a page that runs next to others holds its identifiers until it forgets them
+        with self.lock:
+            for identifier in set(identifiers): self.holds[identifier] = self.holds.get(identifier, 0) + 1
+
+    def forget(self, identifiers):
+        # papers of a finished page live on in the result, not in memory, once no other page holds them
+        with self.lock:
+            for identifier in set(identifiers):
+                holds = self.holds.pop(identifier, 0) - 1
+                if holds > 0: self.holds[identifier] = holds
+                else: self.papers.pop(identifier, None)
+
+    def page_papers(self, page):
+        with self.lock:
+            identifiers = self.pages[page]['identifiers']
+            return [self.papers[i] for i in identifiers if self.papers.get(i) is not None]
+
+    def pdf_done(self, identifier, pdf_num_pages):
+        self.append({ 'type': 'pdf', 'identifier': identifier, 'pdf_num_pages': pdf_num_pages })
@@ -0,0 +1,162 @@
+import re
+import os
+import sys
+import zlib
+import unicodedata
+import numpy as np
+import helpers as h
+import results
+
+# Merges several result files into one corpus without duplicates. Papers are
+# the same when their normalized DOI is the same, or when their normalized
+# titles are (nearly) the same. Near duplicates are found with MinHash and
+# banded LSH, so every title is only compared to the few that share a bucket.
+
+MERSENNE = (1 << 61) - 1
+DOI_PREFIX = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+def normalize_doi(doi):
+    if not isinstance(doi, str): return None
+    doi = DOI_PREFIX.sub('', doi.strip()).strip().lower()
+    return doi if doi.startswith('10.') else None
+
+def normalize_title(title):
+    if not isinstance(title, str): return ''
+    title = h.strip_html(title)
+    if not title.isascii():
+        title = unicodedata.normalize('NFKD', title)
+        title = ''.join(c for c in title if not unicodedata.combining(c))
+    return NON_ALNUM.sub(' ', title.lower()).strip()
+
+def shingles(title, size=3):
+    text = title.replace(' ', '')
+    if len(text) <= size: return set([text])
+    return set(text[i:i + size] for i in range(len(text) - size + 1))
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if len(a) > 0 and len(b) > 0 else 0.0
+
+class MinHasher:
+    def __init__(self, num_hashes=64, seed=1):
+        rng = np.random.RandomState(seed)
+        # a * x + b mod a mersenne prime, a and b stay small so a * x + b fits into 64 bits
+        self.a = rng.randint(1, 1 << 30, size=num_hashes, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 30, size=num_hashes, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        # not hash(), it changes between processes and so would the merge
+        x = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+        values = (self.a[:, None] * x[None, :] + self.b[:, None]) % MERSENNE
+        return values.min(axis=1)
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        root = x
+        while self.parent[root] != root: root = self.parent[root]
+        while self.parent[x] != root: self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b: return a
+        # the earlier paper stays the root, it is the one that is kept
+        if b < a: a, b = b, a
+        self.parent[b] = a
+        return a
+
+def source_of(file_path):
+    # result files live at <cache_folder>/<config_name>/result_<name>.<ext>
+    config_name = os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    if name.startswith('result_'): name = name[len('result_'):]
+    return config_name, name
+
+def load_papers(file_paths):
+    papers = []
+    for file_path in file_paths:
+        config_name, name = source_of(file_path)
+        for paper in results.iter_papers(file_path):
+            source = { 'config_name': config_name, 'name': name, 'identifier': paper.get('identifier') }
+            papers.append((paper, source))
+    return papers
+
+def find_duplicates(papers, threshold=0.75, num_hashes=64, bands=16, min_title_length=20):
+    groups = UnionFind()
+    dois = {}
+    by_doi, by_title = {}, {}
+
+    def can_merge(a, b):
+        # two different DOIs are two different papers, however alike the titles are
+        a, b = groups.find(a), groups.find(b)
+        return a == b or len(dois[a]) == 0 or len(dois[b]) == 0 or len(dois[a] & dois[b]) > 0
+
+    def merge(a, b):
+        a, b = groups.find(a), groups.find(b)
+        if a == b: return
+        doi = dois.pop(a) | dois.pop(b)
+        dois[groups.union(a, b)] = doi
+
+    for i, (paper, _) in enumerate(papers):
+        groups.find(i)
+        doi = normalize_doi(paper.get('doi'))
+        dois[i] = set([doi]) if doi is not None else set()
+        if doi is not None:
+            if doi in by_doi: merge(by_doi[doi], i)
+            else: by_doi[doi] = i
+        title = normalize_title(paper.get('title'))
+        if title == '': continue
+        if title in by_title:
+            if can_merge(by_title[title], i): merge(by_title[title], i)
+        else:
+            by_title[title] = i
+
+    # only one paper per distinct title takes part in the near duplicate search
+    hasher = MinHasher(num_hashes)
+    rows = num_hashes // bands
+    buckets = {}
+    shingle_sets = {}
+    for title, i in by_title.items():
+        if len(title) < min_title_length: continue
+        shingle_sets[i] = shingles(title)
+        signature = hasher.signature(shingle_sets[i])
+        for band in range(bands):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            j = buckets.setdefault(key, i)
+            if j == i or groups.find(i) == groups.find(j): continue
+            if jaccard(shingle_sets[i], shingle_sets[j]) >= threshold and can_merge(i, j): merge(i, j)
+
+    found = {}
+    for i in range(len(papers)): found.setdefault(groups.find(i), []).append(i)
+    return list(found.values())
+
+def merge_group(papers, group):
+    # the first paper wins, the others only fill in fields it left empty
+    paper = dict(papers[group[0]][0])
+    for i in group[1:]:
+        for k, v in papers[i][0].items():
+            if paper.get(k) in (None, '', []) and v not in (None, '', []): paper[k] = v
+    paper['sources'] = [papers[i][1] for i in group]
+    return paper
+
+def merge_results(file_paths, output_path, threshold=0.75):
+    papers = load_papers(file_paths)
+    groups = find_duplicates(papers, threshold)
+    writer = results.open_writer(output_path, { 'sources': [list(source_of(p)) for p in file_paths] })
+    writer.write_papers(merge_group(papers, group) for group in groups)
+    return writer.close({
+        'total_results': len(papers),
+        'total_filtered_results': len(groups),
+        'total_duplicates': len(papers) - len(groups)
+    })
+
+if __name__ == "__main__":
+    # python merge.py ./merged.jsonl ./cache/acm/result_chi.json ./cache/ieee/result_ieeevr.json
+    if len(sys.argv) < 3:
+        sys.exit("usage: python merge.py <output_file> <result_file> [<result_file> ...]")
+    summary = merge_results(sys.argv[2:], sys.argv[1])
+    print("Merged %d papers into %d, %d duplicates" % (summary['total_results'], summary['total_filtered_results'], summary['total_duplicates']))
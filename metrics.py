@@ -0,0 +1,168 @@
+import io
+import os
+import json
+import time
+import threading
+import contextlib
+import helpers as h
+
+# Counters, bytes and latency histograms per stage and host, plus cache hits
+# and misses per kind. Stages are named after what the fetcher does: http,
+# wait (rate limiting), backoff (before a retry), cache_read, cache_write,
+# preprocess, parse, postprocess, pdf_download and pdf_pages.
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]: i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, result = 0, []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def to_dict(self):
+        return { 'buckets': list(self.buckets), 'counts': list(self.counts), 'sum': self.sum, 'count': self.count }
+
+class Stage:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.histogram = Histogram()
+
+    def to_dict(self):
+        return { 'count': self.count, 'errors': self.errors, 'bytes': self.bytes, 'seconds': self.histogram.to_dict() }
+
+def label_text(labels):
+    return ",".join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels.items())
+
+class Metrics:
+    def __init__(self, labels={}):
+        self.labels = dict(labels)
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.cache = {}
+        self.started = time.time()
+
+    def observe(self, stage, seconds, host='', size=0, error=False):
+        with self.lock:
+            s = self.stages.get((stage, host))
+            if s is None: s = self.stages[(stage, host)] = Stage()
+            s.count += 1
+            s.bytes += size
+            if error: s.errors += 1
+            s.histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, stage, host=''):
+        # the block may set info['bytes'], an exception counts as an error
+        info = { 'bytes': 0 }
+        tic = time.perf_counter()
+        try:
+            yield info
+        except BaseException:
+            self.observe(stage, time.perf_counter() - tic, host, info['bytes'], True)
+            raise
+        self.observe(stage, time.perf_counter() - tic, host, info['bytes'])
+
+    def cache_lookup(self, kind, hit):
+        with self.lock:
+            counts = self.cache.setdefault(kind, { 'hit': 0, 'miss': 0 })
+            counts['hit' if hit else 'miss'] += 1
+
+    def to_dict(self):
+        with self.lock:
+            stages = [{ 'stage': stage, 'host': host, **s.to_dict() } for (stage, host), s in sorted(self.stages.items())]
+            cache = {
+                kind: { **counts, 'hit_ratio': counts['hit'] / max(1, counts['hit'] + counts['miss']) }
+                for kind, counts in self.cache.items()
+            }
+        return { 'labels': self.labels, 'uptime': time.time() - self.started, 'stages': stages, 'cache': cache }
+
+    def mean(self, stage):
+        # mean seconds of a stage over all hosts, None before the first observation
+        with self.lock:
+            observed = [s.histogram for (name, _), s in self.stages.items() if name == stage]
+        count = sum(histogram.count for histogram in observed)
+        return sum(histogram.sum for histogram in observed) / count if count > 0 else None
+
+    def summary(self):
+        # seconds per stage over all hosts, slowest first
+        with self.lock:
+            seconds = {}
+            for (stage, _), s in self.stages.items():
+                seconds[stage] = seconds.get(stage, 0) + s.histogram.sum
+        return ", ".join("%s %0.2fs" % item for item in sorted(seconds.items(), key=lambda item: -item[1]))
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self, prefix='finder'):
+        lines = []
+        with self.lock:
+            stages = sorted(self.stages.items())
+            cache = { kind: dict(counts) for kind, counts in self.cache.items() }
+        def metric(name, kind, help):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+
+        metric('stage_seconds', 'histogram', 'Time spent per stage and host.')
+        for (stage, host), s in stages:
+            labels = { **self.labels, 'stage': stage, 'host': host }
+            for le, count in zip(list(s.histogram.buckets) + ['+Inf'], s.histogram.cumulative()):
+                lines.append("%s_stage_seconds_bucket{%s} %d" % (prefix, label_text({ **labels, 'le': le }), count))
+            lines.append("%s_stage_seconds_sum{%s} %f" % (prefix, label_text(labels), s.histogram.sum))
+            lines.append("%s_stage_seconds_count{%s} %d" % (prefix, label_text(labels), s.histogram.count))
+        for name, attr, help in [('stage_bytes_total', 'bytes', 'Bytes handled per stage and host.'), ('stage_errors_total', 'errors', 'Failed calls per stage and host.')]:
+            metric(name, 'counter', help)
+            for (stage, host), s in stages:
+                lines.append("%s_%s{%s} %d" % (prefix, name, label_text({ **self.labels, 'stage': stage, 'host': host }), getattr(s, attr)))
+        metric('cache_lookups_total', 'counter', 'Cache lookups per kind and result.')
+        for kind, counts in sorted(cache.items()):
+            for result in ['hit', 'miss']:
+                lines.append("%s_cache_lookups_total{%s} %d" % (prefix, label_text({ **self.labels, 'kind': kind, 'result': result }), counts[result]))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, file_path):
+        # .prom files get the prometheus text format, anything else json
+        content = self.to_prometheus() if file_path.endswith('.prom') else self.to_json()
+        h.ensure_path_exists(file_path)
+        tmp_path = file_path + ".part"
+        with io.open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, file_path)
+
+class PeriodicDump:
+    # writes the metrics every few seconds while a long crawl runs
+    def __init__(self, metrics, file_path, every=60):
+        self.metrics = metrics
+        self.file_path = file_path
+        self.every = every
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def loop(self):
+        while not self.stop_event.wait(self.every):
+            self.metrics.dump(self.file_path)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
@@ -0,0 +1,123 @@
+import sys
+import json
+import collections
+import time
+import threading
+import pandas as pd
+import helpers as h
+from finder import Fetcher, plan_text
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Runs several finders at once. Finders are grouped by the host of their
+# list url: groups run in parallel, the finders of one group run one after
+# the other, so no host sees more traffic than a single finder would cause.
+
+def load_specs(file_path):
+    # a list of finder dicts like the ones in finder.py, or { "finders": [...] }
+    with open(file_path, "r") as f:
+        if file_path.endswith(('.yml', '.yaml')):
+            if yaml is None: raise Exception("reading %s needs the PyYAML package" % file_path)
+            specs = yaml.safe_load(f)
+        else:
+            specs = json.load(f)
+    return specs['finders'] if isinstance(specs, dict) else specs
+
+def finder_host(fetcher):
+    return h.url_domain(fetcher.list_url(fetcher.get_config('urls.list.start-page', 0)))
+
+def group_by_host(fetchers):
+    groups = {}
+    for fetcher in fetchers:
+        groups.setdefault(finder_host(fetcher), []).append(fetcher)
+    return groups
+
+def run_group(fetchers, timings, resume):
+    for fetcher in fetchers:
+        timing = timings[id(fetcher)]
+        timing['state'] = 'running'
+        tic = time.perf_counter()
+        try:
+            result = fetcher.run(resume)
+            timing['total_results'] = result['total_results']
+            timing['total_filtered_results'] = result['total_filtered_results']
+            timing['state'] = 'done'
+        except Exception as e:
+            # one broken finder should not stop the others on the same host
+            timing['state'] = 'failed'
+            timing['error'] = repr(e)
+        timing['seconds'] = time.perf_counter() - tic
+
+def progress_line(fetchers, timings):
+    parts = []
+    for fetcher in fetchers:
+        timing, status = timings[id(fetcher)], fetcher.status
+        if timing['state'] == 'running':
+            # papers of pages still in flight are only in the journal yet
+            papers = status['papers'] + len(fetcher.journal.papers)
+            parts.append("%s/%s %d/%s pages %d papers" % (fetcher.config_name, fetcher.name, status['pages'], status['total_pages'] or '?', papers))
+        else:
+            parts.append("%s/%s %s" % (fetcher.config_name, fetcher.name, timing['state']))
+    return " | ".join(parts)
+
+def report_progress(fetchers, timings, stop, every):
+    while not stop.wait(every):
+        print(progress_line(fetchers, timings), flush=True)
+
+def run_finders(specs, resume=False, report_every=10, **kwargs):
+    # kwargs are passed to every finder, e.g. restrict_identifiers_to
+    tic = time.perf_counter()
+    fetchers = [Fetcher(**{ 'show_progress': False, **kwargs, **spec }) for spec in specs]
+    timings = { id(f): { 'name': f.name, 'config_name': f.config_name, 'host': finder_host(f), 'state': 'waiting' } for f in fetchers }
+    groups = group_by_host(fetchers)
+    print("Running %d finders on %d hosts" % (len(fetchers), len(groups)))
+
+    stop = threading.Event()
+    reporter = threading.Thread(target=report_progress, args=(fetchers, timings, stop, report_every), daemon=True)
+    reporter.start()
+    with ThreadPoolExecutor(max_workers=max(1, len(groups))) as pool:
+        for future in [pool.submit(run_group, group, timings, resume) for group in groups.values()]:
+            future.result()
+    stop.set()
+    reporter.join()
+
+    toc = time.perf_counter()
+    timings = [timings[id(f)] for f in fetchers]
+    print("", "---------------", "Finished %d finders in %0.4f seconds" % (len(fetchers), toc - tic), sep="\n")
+    for timing in timings:
+        line = "%s - %s (%s): %s in %0.2f seconds" % (timing['config_name'], timing['name'], timing['host'], timing['state'], timing['seconds'])
+        if 'error' in timing: line += ", " + timing['error']
+        print(line)
+    serial = sum(timing['seconds'] for timing in timings)
+    print("Sum of finder times %0.2f seconds, %0.2fx faster than one after the other" % (serial, serial / max(toc - tic, 1e-9)))
+    return { 'seconds': toc - tic, 'finders': timings }
+
+if __name__ == "__main__":
+    # python orchestrator.py ./finders.json [--resume] [--plan] [--prune-records] [--restrict ./identifiers.csv [--targeted]]
+    if len(sys.argv) < 2:
+        sys.exit("usage: python orchestrator.py <finders.json|finders.yaml> [--resume] [--plan] [--prune-records] [--restrict <identifiers.csv> [--targeted]]")
+    kwargs = {}
+    if '--restrict' in sys.argv:
+        identifier_file = sys.argv[sys.argv.index('--restrict') + 1]
+        kwargs['restrict_identifiers_to'] = pd.read_csv(identifier_file, header=None, dtype=str)[0].to_list()
+        # fetch only those identifiers instead of crawling the search
+        kwargs['targeted'] = '--targeted' in sys.argv
+    if '--plan' in sys.argv:
+        # a dry run, nothing is fetched
+        for spec in load_specs(sys.argv[1]):
+            print(plan_text(Fetcher(**{ 'show_progress': False, **kwargs, **spec }).plan()))
+        sys.exit(0)
+    if '--prune-records' in sys.argv:
+        # memoized records of config versions none of the finders uses any more
+        fetchers = [Fetcher(**{ 'show_progress': False, **kwargs, **spec }) for spec in load_specs(sys.argv[1])]
+        versions = collections.defaultdict(set)
+        for f in fetchers: versions[(f.cache_folder, f.config_name)].add(f.record_version())
+        for f in { (f.cache_folder, f.config_name): f for f in fetchers }.values():
+            print("%s: pruned %d memoized records" % (f.config_name, f.prune_records(versions[(f.cache_folder, f.config_name)])))
+        sys.exit(0)
+    summary = run_finders(load_specs(sys.argv[1]), resume='--resume' in sys.argv, **kwargs)
+    if any(timing['state'] == 'failed' for timing in summary['finders']): sys.exit(1)
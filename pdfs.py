@@ -0,0 +1,154 @@
+import re
+import sys
+import mmap
+import time
+import tempfile
+import PyPDF2
+
+STARTXREF = re.compile(rb'startxref\s+(\d+)')
+SUBSECTION = re.compile(rb'\s*(\d+)\s+(\d+)\s+')
+ENTRY = re.compile(rb'(\d{10})\s(\d{5})\s([nf])')
+TRAILER = re.compile(rb'\s*trailer\s*<<')
+OBJECT = re.compile(rb'(\d+)\s+(\d+)\s+obj\b')
+ROOT = re.compile(rb'/Root\s+(\d+)\s+(\d+)\s+R')
+PREV = re.compile(rb'/Prev\s+(\d+)')
+PAGES = re.compile(rb'/Pages\s+(\d+)\s+(\d+)\s+R')
+# the (?!\d) keeps the number whole, so an indirect /Count 12 0 R is never read as a direct 1
+COUNT = re.compile(rb'/Count\s+(\d+)(?!\d)(?!\s+\d+\s+R)')
+
+def xref_section(data, offset):
+    # the subsections (first, count, position of the entries) and the trailer of a classic
+    # xref table, None for an xref stream or anything else that is not where it should be
+    if data[offset:offset + 4] != b'xref': return None
+    position, subsections = offset + 4, []
+    while True:
+        m = SUBSECTION.match(data, position)
+        if m is None: break
+        first, count = int(m.group(1)), int(m.group(2))
+        subsections.append((first, count, m.end()))
+        position = m.end() + 20 * count
+    m = TRAILER.match(data, position)
+    if m is None: return None
+    end = data.find(b'startxref', m.end())
+    return subsections, data[m.end():end if end >= 0 else m.end() + 4096]
+
+def xref_sections(data):
+    # the newest section first, following /Prev back through the incremental updates
+    # the last startxref is the current one
+    m = None
+    for m in STARTXREF.finditer(data, max(0, len(data) - 1024)): pass
+    offset, sections = int(m.group(1)) if m is not None else None, []
+    while offset is not None and len(sections) < 64:
+        section = xref_section(data, offset)
+        if section is None: return None
+        sections.append(section)
+        prev = PREV.search(section[1])
+        offset = int(prev.group(1)) if prev is not None else None
+    return sections if len(sections) > 0 else None
+
+def entry_position(sections, num):
+    for subsections, _ in sections:
+        for first, count, position in subsections:
+            if first <= num < first + count: return position + 20 * (num - first)
+    return None
+
+def read_object(data, sections, num, gen):
+    position = entry_position(sections, num)
+    if position is None: return None
+    entry = ENTRY.match(data, position)
+    if entry is None or entry.group(3) != b'n' or int(entry.group(2)) != gen: return None
+    m = OBJECT.match(data, int(entry.group(1)))
+    if m is None or (int(m.group(1)), int(m.group(2))) != (num, gen): return None
+    end = data.find(b'endobj', m.end())
+    return data[m.end():end] if end >= 0 else None
+
+def fast_page_count(data):
+    # startxref leads to the xref table, the trailer to the catalog and the catalog to the page
+    # tree, so only those few objects are read; anything else goes to the full parser
+    if not data[:1024].lstrip().startswith(b'%PDF-'): return None
+    sections = xref_sections(data)
+    if sections is None: return None
+    roots = [ROOT.search(trailer) for _, trailer in sections]
+    root = next((m for m in roots if m is not None), None)
+    if root is None: return None
+    catalog = read_object(data, sections, *map(int, root.groups()))
+    if catalog is None: return None
+    pages = PAGES.search(catalog)
+    if pages is None: return None
+    # objects inside compressed object streams have no entry in a classic table
+    tree = read_object(data, sections, *map(int, pages.groups()))
+    if tree is None: return None
+    count = COUNT.search(tree)
+    return int(count.group(1)) if count is not None else None
+
+def full_page_count(file_path):
+    with open(file_path, "rb") as f:
+        return PyPDF2.PdfFileReader(f).getNumPages()
+
+def count_pages(file_path):
+    try:
+        with open(file_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                count = fast_page_count(data)
+    except ValueError:
+        # mmap refuses empty files, which are no readable pdf either
+        return None
+    if count is not None: return count
+    try:
+        return full_page_count(file_path)
+    except PyPDF2.utils.PdfReadError:
+        return None
+
+def count_pages_timed(file_path):
+    # the time is measured in the worker, waiting in the pool queue does not count
+    tic = time.perf_counter()
+    count = count_pages(file_path)
+    return count, time.perf_counter() - tic
+
+def sample_pdf(num_pages, indirect_count=False, update=False):
+    # a minimal pdf with a classic xref table, optionally with the page count in its own
+    # object and with an incremental update that replaces the catalog
+    kids = " ".join("%d 0 R" % (4 + i) for i in range(num_pages))
+    count = "3 0 R" if indirect_count else str(num_pages)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", "<< /Type /Pages /Kids [%s] /Count %s >>" % (kids, count), str(num_pages)]
+    objects += ["<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>"] * num_pages
+    out, offsets = b"%PDF-1.4\n", []
+    for num, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (num, body.encode())
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    if update:
+        catalog = len(out)
+        out += b"%d 0 obj\n<< /Type /Catalog /Pages 2 0 R /Lang (en) >>\nendobj\n" % (len(objects) + 1)
+        prev, xref = xref, len(out)
+        out += b"xref\n%d 1\n%010d 00000 n \n" % (len(objects) + 1, catalog)
+        out += b"trailer\n<< /Size %d /Root %d 0 R /Prev %d >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 2, len(objects) + 1, prev, xref)
+    return out
+
+def check():
+    # direct, indirect and multi-digit counts, with and without an incremental update; an indirect
+    # count has no fast answer and must come from the full parser
+    for num_pages in [1, 9, 12, 123]:
+        for indirect_count in [False, True]:
+            for update in [False, True]:
+                data = sample_pdf(num_pages, indirect_count, update)
+                fast = fast_page_count(data)
+                expected = None if indirect_count else num_pages
+                if fast != expected: raise Exception("fast count of %r is %r, not %r" % ((num_pages, indirect_count, update), fast, expected))
+                with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+                    f.write(data)
+                    f.flush()
+                    counted = count_pages(f.name)
+                if counted != num_pages: raise Exception("count of %r is %r, not %d" % ((num_pages, indirect_count, update), counted, num_pages))
+    print("page counts are correct")
+
+if __name__ == "__main__":
+    # python pdfs.py check
+    # python pdfs.py count <file.pdf>
+    if len(sys.argv) < 2 or sys.argv[1] not in ('check', 'count') or (sys.argv[1] == 'count' and len(sys.argv) < 3):
+        sys.exit("usage: python pdfs.py check | python pdfs.py count <file.pdf>")
+    if sys.argv[1] == 'check': check()
+    else: print(count_pages(sys.argv[2]))
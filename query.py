@@ -0,0 +1,82 @@
+import re
+
+# Compiles the should/must/match queries of h.analyze_query into a predicate.
+#
+# match_mode 'substring' keeps the analyze_query semantics: '*' is dropped and
+# the term may appear anywhere. 'word' treats the term as a word pattern:
+# 'touch*' matches words starting with touch, '*touch' words ending with it
+# and 'VR' only the whole word VR.
+
+def term_pattern(term, match_mode='substring'):
+    if match_mode == 'substring': return re.escape(term.replace('*', ''))
+    if match_mode != 'word': raise Exception("match_mode %s could not be found" % match_mode)
+    pattern = r'\w*'.join(re.escape(part) for part in term.split('*'))
+    if not term.startswith('*'): pattern = r'(?<!\w)' + pattern
+    if not term.endswith('*'): pattern = pattern + r'(?!\w)'
+    return pattern
+
+def field_text(item, key):
+    if key not in item: raise Exception(f"could not find {key} in desired item")
+    value = item[key]
+    if isinstance(value, list): return "\n".join(map(str, value))
+    return value if isinstance(value, str) else str(value)
+
+class Match:
+    # true if any of the terms is found in the field
+    def __init__(self, key, terms, case_sensitive=True, match_mode='substring'):
+        self.key = key
+        self.terms = list(terms)
+        self.case_sensitive = case_sensitive
+        self.match_mode = match_mode
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self.pattern = re.compile("|".join(term_pattern(t, match_mode) for t in self.terms), flags)
+
+    def merge(self, other):
+        return Match(self.key, self.terms + other.terms, self.case_sensitive, self.match_mode)
+
+    def __call__(self, item):
+        return self.pattern.search(field_text(item, self.key)) is not None
+
+class Query:
+    def __init__(self, should, must):
+        self.should = should
+        self.must = must
+
+    def __call__(self, item):
+        return (len(self.should) == 0 or any(s(item) for s in self.should)) \
+            and (len(self.must) == 0 or all(m(item) for m in self.must))
+
+def merge_matches(nodes):
+    # within a should, all plain matches on the same field become one alternation
+    merged = {}
+    rest = []
+    for node in nodes:
+        if isinstance(node, Match):
+            merged[node.key] = merged[node.key].merge(node) if node.key in merged else node
+        else:
+            rest.append(node)
+    return list(merged.values()) + rest
+
+def flatten_should(nodes):
+    # a should that only holds a should can be lifted into its parent
+    flat = []
+    for node in nodes:
+        if isinstance(node, Query) and len(node.must) == 0 and len(node.should) > 0:
+            flat += flatten_should(node.should)
+        else:
+            flat.append(node)
+    return flat
+
+def compile_query(query, case_sensitive=True, match_mode='substring'):
+    match = query.get('match', {})
+    if len(match) > 1: raise Exception(f"match should not be longer than 1, found {len(match)} items")
+    # like analyze_query, a match decides the node on its own
+    for key in match:
+        return Match(key, [match[key]], case_sensitive, match_mode)
+
+    should = [compile_query(s, case_sensitive, match_mode) for s in query.get('should', [])]
+    must = [compile_query(m, case_sensitive, match_mode) for m in query.get('must', [])]
+    return Query(merge_matches(flatten_should(should)), must)
+
+def filter_papers(papers, predicate):
+    return [paper for paper in papers if paper is not None and predicate(paper)]
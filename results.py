@@ -0,0 +1,88 @@
+import io
+import json
+import os
+import helpers as h
+
+# A jsonl result is one header line, one line per paper and one footer line:
+#   {"header": {"name": ..., "config_name": ...}}
+#   {"title": ..., "identifier": ...}
+#   {"footer": {"total_results": ..., "total_pages": ..., "total_filtered_results": ...}}
+
+class JsonResultWriter:
+    def __init__(self, file_path, header={}):
+        self.file_path = file_path
+        self.papers = []
+
+    def write_papers(self, papers):
+        self.papers += papers
+
+    def close(self, summary):
+        result = { 'papers': self.papers, **summary }
+        h.write_json_file(self.file_path, result)
+        return result
+
+class JsonlResultWriter:
+    def __init__(self, file_path, header={}):
+        self.file_path = file_path
+        self.tmp_path = file_path + ".part"
+        h.ensure_path_exists(file_path)
+        self.file = io.open(self.tmp_path, "w", encoding="utf-8")
+        self.file.write(json.dumps({ 'header': header }) + "\n")
+
+    def write_papers(self, papers):
+        for paper in papers:
+            self.file.write(json.dumps(paper) + "\n")
+
+    def close(self, summary):
+        self.file.write(json.dumps({ 'footer': summary }) + "\n")
+        self.file.close()
+        os.replace(self.tmp_path, self.file_path)
+        return dict(summary)
+
+def is_jsonl(file_path):
+    return file_path.endswith(".jsonl")
+
+def open_writer(file_path, header={}):
+    return (JsonlResultWriter if is_jsonl(file_path) else JsonResultWriter)(file_path, header)
+
+def iter_lines(file_path):
+    with io.open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip() != '': yield json.loads(line)
+
+def iter_papers(file_path):
+    if not is_jsonl(file_path):
+        result = h.read_json_file(file_path)
+        if not 'papers' in result: raise Exception("Illformed %s" % file_path)
+        yield from result['papers']
+        return
+    for record in iter_lines(file_path):
+        if 'header' in record or 'footer' in record: continue
+        yield record
+
+def read_summary(file_path):
+    if not is_jsonl(file_path):
+        result = h.read_json_file(file_path)
+        if not 'papers' in result: raise Exception("Illformed %s" % file_path)
+        return { k: v for k, v in result.items() if k != 'papers' }
+    with io.open(file_path, "rb") as f:
+        # the footer is the last line, no need to read the papers before it
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 64 * 1024))
+        last = f.read().rstrip(b"\n").rsplit(b"\n", 1)[-1]
+    record = json.loads(last.decode("utf-8"))
+    if not 'footer' in record: raise Exception("Illformed %s, the footer is missing" % file_path)
+    return record['footer']
+
+def rewrite(file_path, update):
+    if not is_jsonl(file_path):
+        result = h.read_json_file(file_path)
+        result['papers'] = [update(paper) for paper in result['papers']]
+        h.write_json_file(file_path, result)
+        return
+    tmp_path = file_path + ".part"
+    with io.open(tmp_path, "w", encoding="utf-8") as f:
+        for record in iter_lines(file_path):
+            if not 'header' in record and not 'footer' in record: record = update(record)
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, file_path)